@@ -0,0 +1,97 @@
+# Latency of deep /books pages, ?page= (LIMIT/OFFSET) against the
+# ?after_id= cursors, through the Flask test client and against the database
+# models.py points at. The books table is first filled up to --books rows
+# with generated books; the cursor of each page is looked up outside of the
+# timing. OFFSET grows with the page number, the cursors should stay flat:
+#
+#   python benchmarks/bench_pages.py
+#   python benchmarks/bench_pages.py --books 1000000 --pages 1 1000 100000 --requests 50
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flaskr import create_app, encode_cursor, BOOKS_PER_SHELF
+from models import db, Book
+
+app = create_app()
+
+
+# generated titles and names draw from these, so that searches match a few
+# books (a rare word) or many (a common one), as in a real catalog
+WORDS = ['word{}'.format(number) for number in range(20000)]
+NAMES = ['name{}'.format(number) for number in range(5000)]
+
+
+def generated_book(rng):
+    # word ranks follow a power law, like the words of real titles
+    words = [WORDS[min(int(rng.paretovariate(1.1)) - 1, len(WORDS) - 1)] for _ in range(rng.randint(2, 6))]
+    return {
+        'title': ' '.join(words).capitalize(),
+        'author': '{} {}'.format(rng.choice(NAMES), rng.choice(NAMES)).title(),
+        'rating': rng.randint(1, 5)
+    }
+
+
+def fill(books, batch_size=10000, seed=42):
+    # inserts generated books until the table holds `books` rows
+    rng = random.Random(seed)
+    with app.app_context():
+        count = db.session.query(db.func.count(Book.id)).scalar()
+        while count < books:
+            batch = min(batch_size, books - count)
+            db.session.execute(Book.__table__.insert(), [generated_book(rng) for _ in range(batch)])
+            db.session.commit()
+            count += batch
+        return count
+
+
+def cursor_before(page):
+    # the after_id that starts at the same books as ?page=page
+    if page == 1:
+        return ''
+    with app.app_context():
+        book_id = db.session.query(Book.id).order_by(Book.id).offset((page - 1) * BOOKS_PER_SHELF - 1).limit(1).scalar()
+    return encode_cursor(book_id)
+
+
+def timed(client, path, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            sys.exit('{} answered {}'.format(path, response.status_code))
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(int(0.95 * len(timings)), len(timings) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare OFFSET and cursor pagination of /books.')
+    parser.add_argument('--books', type=int, default=BOOKS_PER_SHELF * 100000,
+                        help='rows the books table is filled up to')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 10000, 100000],
+                        help='page numbers to request')
+    parser.add_argument('--requests', type=int, default=20, help='requests per page and mode')
+    args = parser.parse_args()
+
+    total = fill(args.books)
+    client = app.test_client()
+    print('{} books\n'.format(total))
+    print('{:>8} {:>12} {:>12} {:>12} {:>12}'.format('page', 'offset p50', 'offset p95', 'cursor p50', 'cursor p95'))
+    for page in args.pages:
+        if (page - 1) * BOOKS_PER_SHELF >= total:
+            print('{:>8} beyond the last book'.format(page))
+            continue
+        offset = timed(client, '/books?page={}'.format(page), args.requests)
+        cursor = timed(client, '/books?after_id={}'.format(cursor_before(page)), args.requests)
+        print('{:>8} {:>9.2f} ms {:>9.2f} ms {:>9.2f} ms {:>9.2f} ms'.format(page, *offset + cursor))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Latency of /books/search, through the Flask test client and against the
+# database models.py points at, after filling the books table up to --books
+# rows like bench_pages.py does. Terms go from a word found in a handful of
+# titles to one found in a large share of them, with an author name and a
+# two word query in between:
+#
+#   python benchmarks/bench_search.py
+#   python benchmarks/bench_search.py --books 1000000 --requests 50 --budget-ms 25
+#
+# Every match is ranked, so the common words cost the most on both databases.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_pages import app, fill
+from models import db
+
+TERMS = ['word15000', 'word500', 'word20', 'word1', 'name42', 'word3 word7']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure /books/search.')
+    parser.add_argument('--books', type=int, default=1000000, help='rows the books table is filled up to')
+    parser.add_argument('--requests', type=int, default=20, help='requests per term')
+    parser.add_argument('--budget-ms', type=float, help='highest p50 accepted, none by default')
+    args = parser.parse_args()
+
+    total = fill(args.books)
+    client = app.test_client()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print('{} books on {}\n'.format(total, dialect))
+    print('{:<14} {:>9} {:>9} {:>9}'.format('term', 'matches', 'p50 ms', 'p95 ms'))
+    failures = []
+    for term in TERMS:
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get('/books/search', query_string={'q': term})
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50, p95 = timings[len(timings) // 2], timings[min(int(0.95 * len(timings)), len(timings) - 1)]
+        print('{:<14} {:>9} {:>9.2f} {:>9.2f}'.format(term, response.get_json()['total_books'], p50, p95))
+        if args.budget_ms is not None and p50 > args.budget_ms:
+            failures.append(term)
+    if failures:
+        print('\nFAIL: over the {:.0f} ms budget: {}'.format(args.budget_ms, ', '.join(failures)))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
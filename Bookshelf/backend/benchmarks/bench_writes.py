@@ -0,0 +1,78 @@
+# Write throughput of the batch endpoints against the per-row ones, through
+# the Flask test client and against the database models.py points at: --rows
+# books created with POST /books then with POST /books/batch, and rated with
+# PATCH /books/<id> then with PATCH /books/ratings. The per-row creates ask
+# for `Prefer: return=minimal`, so both sides only write. The books created
+# are deleted at the end.
+#
+#   python benchmarks/bench_writes.py
+#   python benchmarks/bench_writes.py --rows 5000 --batch-size 1000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_pages import app, generated_book
+from models import db, Book
+
+
+def rate(label, rows, seconds):
+    print('{:<28} {:>10.0f} rows/s'.format(label, rows / seconds))
+    return rows / seconds
+
+
+def timed(send):
+    start = time.perf_counter()
+    send()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-row and batch writes of Bookshelf.')
+    parser.add_argument('--rows', type=int, default=2000, help='books created and rated on each side')
+    parser.add_argument('--batch-size', type=int, default=500, help='items per batch request')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    client = app.test_client()
+    books = [generated_book(rng) for _ in range(args.rows)]
+    created = []
+
+    def per_row_creates():
+        for book in books:
+            response = client.post('/books', json=book, headers={'Prefer': 'return=minimal'})
+            created.append(response.get_json()['created'])
+
+    def batch_creates():
+        for start in range(0, len(books), args.batch_size):
+            response = client.post('/books/batch', json={'books': books[start:start + args.batch_size]})
+            created.extend(result['id'] for result in response.get_json()['results'])
+
+    def per_row_ratings():
+        for book_id in created[:args.rows]:
+            client.patch('/books/{}'.format(book_id), json={'rating': rng.randint(1, 5)})
+
+    def batch_ratings():
+        ratings = [{'id': book_id, 'rating': rng.randint(1, 5)} for book_id in created[args.rows:]]
+        for start in range(0, len(ratings), args.batch_size):
+            client.patch('/books/ratings', json={'ratings': ratings[start:start + args.batch_size]})
+
+    try:
+        single = rate('POST /books', args.rows, timed(per_row_creates))
+        batch = rate('POST /books/batch', args.rows, timed(batch_creates))
+        print('{:<28} {:>10.1f}x\n'.format('speedup', batch / single))
+        single = rate('PATCH /books/<id>', args.rows, timed(per_row_ratings))
+        batch = rate('PATCH /books/ratings', args.rows, timed(batch_ratings))
+        print('{:<28} {:>10.1f}x'.format('speedup', batch / single))
+    finally:
+        with app.app_context():
+            Book.query.filter(Book.id.in_(created)).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,124 @@
 import os
+import base64
+import binascii
 from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy #, or_
+from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Book
+from models import setup_db, database_path, db, Book, BookCount
+from search import search_books
+from sqlprofiler import SQLProfiler
 
 BOOKS_PER_SHELF = 8
-
-def paginate_books(request, selection):
+# the largest ?per_page= served, bigger values are capped to it
+MAX_BOOKS_PER_SHELF = 100
+# seconds the total_books of the responses may lag writes made by other
+# processes
+TOTAL_BOOKS_TTL = 60
+
+def requested_page(request):
+  # (page, per_page) of the request, 400 below 1
   page = request.args.get('page', 1, type=int)
-  start =  (page - 1) * BOOKS_PER_SHELF
-  end = start + BOOKS_PER_SHELF
+  per_page = min(request.args.get('per_page', BOOKS_PER_SHELF, type=int), MAX_BOOKS_PER_SHELF)
+  if page < 1 or per_page < 1:
+    abort(400)
+  return page, per_page
 
-  books = [book.format() for book in selection]
-  current_books = books[start:end]
-
-  return current_books
+def paginate_books(request, selection):
+  # the requested page of the selection query, fetched with LIMIT/OFFSET
+  page, per_page = requested_page(request)
+  books = selection.order_by(Book.id).limit(per_page).offset((page - 1) * per_page).all()
+
+  return [book.format() for book in books]
+
+def minimal_response(request, **body):
+  # `Prefer: return=minimal` (RFC 7240) on a write: only the success flag and
+  # the id, no page or total, so the write costs the same for any catalog
+  # size; None otherwise
+  if 'return=minimal' not in request.headers.get('Prefer', ''):
+    return None
+  response = jsonify(success=True, **body)
+  response.headers['Preference-Applied'] = 'return=minimal'
+  return response
+
+# the most items a batch endpoint takes in one request
+MAX_BATCH_SIZE = 1000
+
+def requested_items(request, key):
+  # the list under key in the JSON body, 400 when missing or too long
+  body = request.get_json(silent=True) or {}
+  items = body.get(key) if isinstance(body, dict) else None
+  if not isinstance(items, list) or not 1 <= len(items) <= MAX_BATCH_SIZE:
+    abort(400)
+  return items
+
+def item_error(index, status, message):
+  return {'index': index, 'success': False, 'error': status, 'message': message}
+
+# the stars of the frontend
+MIN_RATING, MAX_RATING = 1, 5
+RATING_ERROR = 'The rating must be an integer from {} to {}'.format(MIN_RATING, MAX_RATING)
+
+def parse_rating(value):
+  # value as a rating, None when it is not an integer in range
+  try:
+    rating = int(value)
+  except (TypeError, ValueError, OverflowError):
+    return None
+  return rating if MIN_RATING <= rating <= MAX_RATING else None
+
+def new_book_row(item):
+  # (row, None) for a valid new book, (None, message) otherwise
+  if not isinstance(item, dict):
+    return None, 'A book must be an object'
+  title, author = item.get('title'), item.get('author')
+  if not isinstance(title, str) or not title.strip() or not isinstance(author, str) or not author.strip():
+    return None, 'A book needs a title and an author'
+  rating = item.get('rating')
+  if rating is not None:
+    rating = parse_rating(rating)
+    if rating is None:
+      return None, RATING_ERROR
+  return {'title': title, 'author': author, 'rating': rating}, None
+
+def encode_cursor(book_id):
+  # opaque to the clients, which only pass it back
+  return base64.urlsafe_b64encode(str(book_id).encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+  try:
+    return int(base64.urlsafe_b64decode(cursor.encode('ascii')))
+  except (ValueError, binascii.Error):
+    abort(400)
+
+def keyset_books(request, selection):
+  # the page after ?after_id= or before ?before_id=, given the next_cursor
+  # or previous_cursor of another page (an empty after_id starts at the
+  # first book): a range scan on the primary key, as fast for the last page
+  # as for the first, unlike OFFSET. Returns (books, next, previous).
+  _, per_page = requested_page(request)
+  after_id = request.args.get('after_id')
+  before_id = request.args.get('before_id')
+  if after_id is not None and before_id is not None:
+    abort(400)
+
+  if before_id is not None:
+    books = selection.filter(Book.id < decode_cursor(before_id)).order_by(Book.id.desc()).limit(per_page + 1).all()
+    more = len(books) > per_page
+    books = books[:per_page][::-1]
+    next_cursor = encode_cursor(books[-1].id) if books else None
+    previous_cursor = encode_cursor(books[0].id) if more else None
+  else:
+    if after_id:
+      selection = selection.filter(Book.id > decode_cursor(after_id))
+    books = selection.order_by(Book.id).limit(per_page + 1).all()
+    more = len(books) > per_page
+    books = books[:per_page]
+    next_cursor = encode_cursor(books[-1].id) if more else None
+    previous_cursor = encode_cursor(books[0].id) if after_id and books else None
+
+  return [book.format() for book in books], next_cursor, previous_cursor
 
 # @TODO: General Instructions
 #   - As you're creating endpoints, define them and then search for 'TODO' within the frontend to update the endpoints there.
@@ -27,8 +129,12 @@ def paginate_books(request, selection):
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.update(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+  SQLProfiler(app)
   CORS(app)
+  total_books = BookCount(ttl=TOTAL_BOOKS_TTL)
 
   # CORS Headers
   @app.after_request
@@ -46,20 +152,43 @@ def create_app(test_config=None):
 
   @app.route('/books')
   def get_books():
-      page = request.args.get('page', 1, type=int)
-      start = (page - 1) * BOOKS_PER_SHELF
-      end = start + BOOKS_PER_SHELF
+      # ?page= (with LIMIT/OFFSET), or ?after_id= / ?before_id= cursors for
+      # deep pages, see keyset_books
+      if 'after_id' in request.args or 'before_id' in request.args:
+          current_books, next_cursor, previous_cursor = keyset_books(request, Book.query)
+      else:
+          page, _ = requested_page(request)
+          current_books = paginate_books(request, Book.query)
+          # a client can switch to the cursors from any page
+          next_cursor = encode_cursor(current_books[-1]['id']) if current_books else None
+          previous_cursor = encode_cursor(current_books[0]['id']) if current_books and page > 1 else None
+
+      if len(current_books) == 0:
+          abort(404)
 
-      books = Book.query.order_by(Book.id).all()
-      formatted_books = [book.format() for book in books]
+      return jsonify({
+            'success': True,
+            'books': current_books,
+            'total_books': total_books.get(),
+            'next_cursor': next_cursor,
+            'previous_cursor': previous_cursor
+            })
 
-      if len(formatted_books[start:end]) == 0:
-          abort(404)
+  @app.route('/books/search')
+  def search():
+      # ?q= ranked full-text search over titles and authors, paginated like
+      # /books, see search.py
+      term = request.args.get('q', '').strip()
+      if not term:
+          abort(400)
+      page, per_page = requested_page(request)
+      current_books, total, capped = search_books(term, page, per_page)
 
       return jsonify({
             'success': True,
-            'books':formatted_books[start:end],
-            'total_books':len(formatted_books)
+            'books': current_books,
+            'total_books': total,
+            'total_capped': capped
             })
 
   # @TODO: Write a route that will update a single book's rating.
@@ -107,14 +236,17 @@ def create_app(test_config=None):
               abort(404)
 
           book.delete()
-          selection = Book.query.order_by(Book.id).all()
-          current_books = paginate_books(request, selection)
+          total_books.adjust(-1)
+
+          minimal = minimal_response(request, deleted=book_id)
+          if minimal is not None:
+            return minimal
 
           return jsonify({
             'success': True,
             'deleted': book_id,
-            'books': current_books,
-            'total_books': len(Book.query.all())
+            'books': paginate_books(request, Book.query),
+            'total_books': total_books.get()
             })
 
       except:
@@ -136,20 +268,100 @@ def create_app(test_config=None):
     try:
       book = Book(title=new_title, author=new_author, rating=new_rating)
       book.insert()
+      total_books.adjust(1)
 
-      selection = Book.query.order_by(Book.id).all()
-      current_books = paginate_books(request, selection)
+      minimal = minimal_response(request, created=book.id)
+      if minimal is not None:
+        return minimal
 
       return jsonify({
         'success': True,
         'created': book.id,
-        'books': current_books,
-        'total_books': len(Book.query.all())
+        'books': paginate_books(request, Book.query),
+        'total_books': total_books.get()
       })
 
     except:
       abort(422)
 
+  # Batches: every valid item is applied in a single transaction with bulk
+  # statements, the invalid ones are reported next to them by index
+
+  @app.route('/books/batch', methods=['POST'])
+  def create_books():
+      # {'books': [{'title', 'author', 'rating'}, ...]}
+      items = requested_items(request, 'books')
+      results = [None] * len(items)
+      rows, indexes = [], []
+      for index, item in enumerate(items):
+        row, message = new_book_row(item)
+        if row is None:
+          results[index] = item_error(index, 400, message)
+        else:
+          rows.append(row)
+          indexes.append(index)
+
+      try:
+        ids = Book.insert_many(rows) if rows else []
+        db.session.commit()
+      except:
+        db.session.rollback()
+        abort(422)
+      finally:
+        db.session.close()
+      total_books.adjust(len(ids))
+
+      for index, book_id in zip(indexes, ids):
+        results[index] = {'index': index, 'success': True, 'id': book_id}
+      return jsonify({
+        'success': True,
+        'created': len(ids),
+        'failed': len(items) - len(ids),
+        'results': results
+      })
+
+  @app.route('/books/ratings', methods=['PATCH'])
+  def update_ratings():
+      # {'ratings': [{'id', 'rating'}, ...]}
+      items = requested_items(request, 'ratings')
+      results = [None] * len(items)
+      ratings = {}
+      for index, item in enumerate(items):
+        try:
+          book_id, rating = int(item['id']), item['rating']
+        except (KeyError, TypeError, ValueError, OverflowError):
+          results[index] = item_error(index, 400, 'A rating needs an integer id and rating')
+          continue
+        rating = parse_rating(rating)
+        if rating is None:
+          results[index] = item_error(index, 400, RATING_ERROR)
+          continue
+        ratings[book_id] = rating
+        results[index] = book_id
+
+      try:
+        existing = Book.update_ratings(ratings)
+        db.session.commit()
+      except:
+        db.session.rollback()
+        abort(422)
+      finally:
+        db.session.close()
+
+      for index, result in enumerate(results):
+        if isinstance(result, int):
+          if result in existing:
+            results[index] = {'index': index, 'success': True, 'id': result}
+          else:
+            results[index] = item_error(index, 404, 'There is no book with id {}'.format(result))
+      updated = sum(1 for result in results if result['success'])
+      return jsonify({
+        'success': True,
+        'updated': updated,
+        'failed': len(items) - updated,
+        'results': results
+      })
+
   @app.errorhandler(404)
   def not_found(error):
       return jsonify({
@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------#
+# Search
+#----------------------------------------------------------------------------#
+
+# Ranked full-text search over the title and author of the books.
+#
+# On PostgreSQL the matches come from a GIN index on the tsvector of title
+# and author (ix_books_search, created with the table or by books.psql) and
+# are ranked by ts_rank_cd. Only the rows of the requested page go through
+# ts_headline. On SQLite, for local runs, an FTS5 table created alongside the
+# books table by db.create_all() and kept in sync with triggers ranks the
+# results by bm25 and highlights them.
+#
+# Both highlighters return the text as stored, so they mark the matches with
+# control characters; the text is HTML-escaped before these become <mark>
+# tags, and a highlight is always safe to insert as HTML.
+#
+# Both read the query like websearch_to_tsquery: every word must match,
+# "quoted words" as a phrase, `or` between two alternatives and a leading -
+# to exclude a word or phrase. FTS5 cannot run a search made of exclusions
+# only, which finds nothing on SQLite.
+#
+# Every match is ranked, so a word found in half the catalog costs a pass
+# over half the catalog; only the page is returned. The count of the matches
+# stops at SEARCH_MAX_MATCHES, and total_capped tells the client there are
+# more.
+
+import html
+import re
+
+from models import db, Book
+
+CONFIG = 'english'
+
+# the index expression; the query repeats it verbatim so the planner uses it
+DOCUMENT = "to_tsvector('{}', coalesce(title, '') || ' ' || coalesce(author, ''))".format(CONFIG)
+
+FTS_TABLE = 'books_fts'
+
+MARK = ('<mark>', '</mark>')
+
+# what the highlighters put around a match, replaced by MARK once escaped
+SELECTION = ('\x02', '\x03')
+
+SEARCH_MAX_MATCHES = 1000
+
+
+db.event.listen(
+    Book.__table__,
+    'after_create',
+    db.DDL('CREATE INDEX IF NOT EXISTS ix_books_search ON books USING gin (({}))'.format(DOCUMENT)).execute_if(
+        dialect='postgresql')
+)
+
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "title, author, content='books', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER {fts}_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO {fts}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER {fts}_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER {fts}_au AFTER UPDATE OF title, author ON books BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO {fts}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+]
+
+# the FTS5 table lives and dies with the books table (sqlite only)
+for statement in _FTS_DDL:
+    db.event.listen(
+        Book.__table__,
+        'after_create',
+        db.DDL(statement.format(fts=FTS_TABLE)).execute_if(dialect='sqlite')
+    )
+db.event.listen(
+    Book.__table__,
+    'before_drop',
+    db.DDL('DROP TABLE IF EXISTS {}'.format(FTS_TABLE)).execute_if(dialect='sqlite')
+)
+
+
+def search_books(term, page, per_page):
+    '''
+    search_books(term, page, per_page)
+        returns (books, total, capped): the page-th page of per_page books
+        whose title or author match term, best first, with the matched
+        words of their title and author marked in 'highlight'; the number
+        of matches, at most SEARCH_MAX_MATCHES; whether there are more
+    '''
+    if db.engine.dialect.name == 'sqlite':
+        books, total = _search_sqlite(term, page, per_page)
+    else:
+        books, total = _search_postgresql(term, page, per_page)
+    return books, min(total, SEARCH_MAX_MATCHES), total > SEARCH_MAX_MATCHES
+
+
+def _search_postgresql(term, page, per_page):
+    query = db.func.websearch_to_tsquery(CONFIG, term)
+    matches = db.literal_column(DOCUMENT).op('@@')(query)
+    total = db.session.query(db.func.count()).select_from(
+        db.session.query(Book.id).filter(matches).limit(SEARCH_MAX_MATCHES + 1).subquery()).scalar()
+
+    # every match is ranked, the LIMIT keeps only the page in a top-N sort
+    rank = db.func.ts_rank_cd(db.literal_column(DOCUMENT), query).label('rank')
+    found = db.session.query(Book.id, Book.title, Book.author, Book.rating, rank).filter(matches).order_by(
+        rank.desc(), Book.id).limit(per_page).offset((page - 1) * per_page).subquery()
+    options = 'StartSel={}, StopSel={}, HighlightAll=true'.format(*SELECTION)
+    rows = db.session.query(
+        found.c.id,
+        found.c.title,
+        found.c.author,
+        found.c.rating,
+        db.func.ts_headline(CONFIG, db.func.coalesce(found.c.title, ''), query, options),
+        db.func.ts_headline(CONFIG, db.func.coalesce(found.c.author, ''), query, options)
+    ).order_by(found.c.rank.desc(), found.c.id)
+    return [_format(*row) for row in rows], total
+
+
+_QUERY_TOKEN = re.compile(r'(-?)(?:"([^"]*)"?|(\S+))')
+
+
+def fts5_query(term):
+    '''
+    fts5_query(term)
+        the FTS5 MATCH expression of a websearch_to_tsquery style term, or
+        None when it has nothing FTS5 can search for
+    '''
+    # alternatives separated by `or`, each a list of (excluded, text)
+    alternatives = [[]]
+    for excluded, phrase, word in _QUERY_TOKEN.findall(term):
+        text = phrase if phrase or word == '' else word
+        if not excluded and word.lower() == 'or':
+            alternatives.append([])
+        elif re.search(r'\w', text):
+            alternatives[-1].append((bool(excluded), '"{}"'.format(text.replace('"', '""'))))
+    expressions = []
+    for terms in alternatives:
+        included = [text for excluded, text in terms if not excluded]
+        if included:
+            expressions.append('(' + ' AND '.join(included) + ''.join(
+                ' NOT ' + text for excluded, text in terms if excluded) + ')')
+    return ' OR '.join(expressions) or None
+
+
+def _search_sqlite(term, page, per_page):
+    match = fts5_query(term)
+    if match is None:
+        return [], 0
+    total = db.session.execute(db.text(
+        'SELECT count(*) FROM (SELECT rowid FROM {0} WHERE {0} MATCH :match LIMIT :limit)'.format(FTS_TABLE)
+    ), {'match': match, 'limit': SEARCH_MAX_MATCHES + 1}).scalar()
+    if not total:
+        return [], 0
+
+    rows = db.session.execute(db.text(
+        "SELECT books.id, books.title, books.author, books.rating, "
+        "highlight({0}, 0, :start, :stop), highlight({0}, 1, :start, :stop) "
+        "FROM {0} JOIN books ON books.id = {0}.rowid WHERE {0} MATCH :match "
+        "ORDER BY {0}.rank, books.id LIMIT :limit OFFSET :offset".format(FTS_TABLE)
+    ), {
+        'match': match,
+        'start': SELECTION[0],
+        'stop': SELECTION[1],
+        'limit': per_page,
+        'offset': (page - 1) * per_page
+    })
+    return [_format(*row) for row in rows], total
+
+
+def _format(id, title, author, rating, title_highlight, author_highlight):
+    return {
+        'id': id,
+        'title': title,
+        'author': author,
+        'rating': rating,
+        'highlight': {
+            'title': _mark(title_highlight),
+            'author': _mark(author_highlight)
+        }
+    }
+
+
+def _mark(highlight):
+    # escaping leaves the control characters alone; a title holding one
+    # can only unbalance the marks, never inject markup
+    text = html.escape(highlight or '')
+    return text.replace(SELECTION[0], MARK[0]).replace(SELECTION[1], MARK[1])
@@ -0,0 +1,244 @@
+import os
+import unittest
+import json
+
+from flaskr import create_app, encode_cursor
+from models import db, Book
+import search
+
+
+class BookshelfTestCase(unittest.TestCase):
+    """This class represents the bookshelf test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "bookshelf_test"
+        self.database_path = os.environ.get(
+            'TEST_DATABASE_URL', "postgresql://{}/{}".format('localhost:5432', self.database_name))
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path, 'TESTING': True})
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            for number in range(1, 21):
+                db.session.add(Book(title='Book {}'.format(number), author='Author {}'.format(number % 3),
+                                    rating=number % 5 + 1))
+            db.session.commit()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def ids(self, res):
+        return [book['id'] for book in json.loads(res.data)['books']]
+
+    def test_get_paginated_books(self):
+        res = self.client().get('/books')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_books'], 20)
+        self.assertEqual(self.ids(res), list(range(1, 9)))
+        self.assertEqual(self.ids(self.client().get('/books?page=3')), list(range(17, 21)))
+
+    def test_per_page_is_capped(self):
+        res = self.client().get('/books?per_page=1000')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(self.ids(res)), 20)
+
+    def test_400_below_the_first_page(self):
+        self.assertEqual(self.client().get('/books?page=0').status_code, 400)
+        self.assertEqual(self.client().get('/books?per_page=0').status_code, 400)
+        self.assertEqual(self.client().get('/books?after_id=&per_page=-1').status_code, 400)
+
+    def test_404_beyond_the_last_page(self):
+        res = self.client().get('/books?page=100')
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_cursors_walk_every_book_both_ways(self):
+        seen, path = [], '/books?after_id=&per_page=6'
+        while path:
+            data = json.loads(self.client().get(path).data)
+            seen += [book['id'] for book in data['books']]
+            last = data
+            path = '/books?after_id={}&per_page=6'.format(data['next_cursor']) if data['next_cursor'] else None
+        self.assertEqual(seen, list(range(1, 21)))
+
+        seen = [book['id'] for book in last['books']]
+        path = '/books?before_id={}&per_page=6'.format(last['previous_cursor'])
+        while path:
+            data = json.loads(self.client().get(path).data)
+            seen = [book['id'] for book in data['books']] + seen
+            path = '/books?before_id={}&per_page=6'.format(data['previous_cursor']) if data['previous_cursor'] else None
+        self.assertEqual(seen, list(range(1, 21)))
+
+    def test_page_links_to_the_cursors(self):
+        data = json.loads(self.client().get('/books?page=2').data)
+
+        self.assertEqual(self.ids(self.client().get('/books?after_id={}'.format(data['next_cursor']))),
+                         list(range(17, 21)))
+        self.assertEqual(self.ids(self.client().get('/books?before_id={}'.format(data['previous_cursor']))),
+                         list(range(1, 9)))
+
+    def test_cursor_edges(self):
+        self.assertEqual(self.client().get('/books?before_id={}'.format(encode_cursor(1))).status_code, 404)
+        self.assertEqual(self.client().get('/books?after_id={}'.format(encode_cursor(20))).status_code, 404)
+        data = json.loads(self.client().get('/books?before_id={}'.format(encode_cursor(3))).data)
+        self.assertEqual([book['id'] for book in data['books']], [1, 2])
+        self.assertIsNone(data['previous_cursor'])
+
+        self.assertEqual(self.client().get('/books?after_id=x&before_id=y').status_code, 400)
+        self.assertEqual(self.client().get('/books?after_id=not-a-cursor').status_code, 400)
+
+    def test_create_book(self):
+        res = self.client().post('/books', json={'title': 'Dune', 'author': 'Frank Herbert', 'rating': 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created'], 21)
+        self.assertEqual(data['total_books'], 21)
+        self.assertEqual(len(data['books']), 8)
+
+    def test_create_and_delete_with_minimal_return(self):
+        res = self.client().post('/books', json={'title': 'Dune', 'author': 'Frank Herbert', 'rating': 5},
+                                 headers={'Prefer': 'return=minimal'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), {'success': True, 'created': 21})
+        self.assertEqual(res.headers['Preference-Applied'], 'return=minimal')
+
+        res = self.client().delete('/books/21', headers={'Prefer': 'return=minimal'})
+        self.assertEqual(json.loads(res.data), {'success': True, 'deleted': 21})
+        self.assertEqual(json.loads(self.client().get('/books').data)['total_books'], 20)
+
+    def test_422_deleting_a_missing_book(self):
+        res = self.client().delete('/books/1000')
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_search_ranks_and_highlights(self):
+        with self.app.app_context():
+            db.session.add(Book(title='Dune', author='Frank Herbert', rating=5))
+            db.session.add(Book(title='Children of Dune', author='Frank Herbert', rating=4))
+            db.session.commit()
+        res = self.client().get('/books/search?q=herbert')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_books'], 2)
+        self.assertEqual(sorted(book['title'] for book in data['books']), ['Children of Dune', 'Dune'])
+        self.assertEqual(data['books'][0]['highlight']['author'], 'Frank <mark>Herbert</mark>')
+        self.assertEqual(json.loads(self.client().get('/books/search?q=tolkien').data)['books'], [])
+
+    def test_search_highlights_are_escaped(self):
+        with self.app.app_context():
+            db.session.add(Book(title='<script>alert(1)</script> & Dune', author='Frank Herbert', rating=5))
+            db.session.commit()
+        data = json.loads(self.client().get('/books/search?q=dune').data)
+
+        self.assertEqual(data['books'][0]['title'], '<script>alert(1)</script> & Dune')
+        self.assertEqual(data['books'][0]['highlight']['title'],
+                         '&lt;script&gt;alert(1)&lt;/script&gt; &amp; <mark>Dune</mark>')
+
+    def test_search_reads_phrases_alternatives_and_exclusions(self):
+        with self.app.app_context():
+            db.session.add(Book(title='Dune', author='Frank Herbert', rating=5))
+            db.session.add(Book(title='Children of Dune', author='Frank Herbert', rating=4))
+            db.session.add(Book(title='Frankenstein', author='Mary Shelley', rating=4))
+            db.session.commit()
+
+        def titles(term):
+            data = json.loads(self.client().get('/books/search', query_string={'q': term}).data)
+            return sorted(book['title'] for book in data['books'])
+
+        self.assertEqual(titles('frank -children'), ['Dune'])
+        self.assertEqual(titles('"children of dune"'), ['Children of Dune'])
+        self.assertEqual(titles('"dune children"'), [])
+        self.assertEqual(titles('shelley or "children of dune"'), ['Children of Dune', 'Frankenstein'])
+
+    def test_search_ranks_every_match(self):
+        # the best match has the highest id, past the first two matches
+        self.addCleanup(setattr, search, 'SEARCH_MAX_MATCHES', search.SEARCH_MAX_MATCHES)
+        search.SEARCH_MAX_MATCHES = 2
+        with self.app.app_context():
+            for number in range(3):
+                db.session.add(Book(title='A long history of dunes and of the deserts around them, part {}'.format(
+                    number), author='Somebody Else', rating=3))
+            db.session.add(Book(title='Dune', author='Dune', rating=5))
+            db.session.commit()
+        data = json.loads(self.client().get('/books/search?q=dune').data)
+
+        self.assertEqual(data['books'][0]['title'], 'Dune')
+        self.assertEqual((data['total_books'], data['total_capped']), (2, True))
+
+    def test_400_search_without_a_term(self):
+        self.assertEqual(self.client().get('/books/search?q=').status_code, 400)
+
+    def test_batch_create_reports_each_item(self):
+        res = self.client().post('/books/batch', json={'books': [
+            {'title': 'Dune', 'author': 'Frank Herbert', 'rating': 5},
+            {'title': '', 'author': 'Nobody'},
+            'Dune Messiah',
+            {'title': 'Emma', 'author': 'Jane Austen', 'rating': 'five'}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['created'], data['failed']), (1, 3))
+        self.assertEqual(data['results'][0], {'index': 0, 'success': True, 'id': 21})
+        self.assertEqual([result['error'] for result in data['results'][1:]], [400, 400, 400])
+        self.assertEqual(json.loads(self.client().get('/books').data)['total_books'], 21)
+
+    def test_batch_ratings_report_each_item(self):
+        res = self.client().patch('/books/ratings', json={'ratings': [
+            {'id': 1, 'rating': 5},
+            {'id': 1000, 'rating': 1},
+            {'id': 'one'}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['updated'], data['failed']), (1, 2))
+        self.assertEqual([result['success'] for result in data['results']], [True, False, False])
+        self.assertEqual([result.get('error') for result in data['results']], [None, 404, 400])
+        with self.app.app_context():
+            self.assertEqual(Book.query.get(1).rating, 5)
+
+    def test_batches_reject_ratings_out_of_range(self):
+        res = self.client().post('/books/batch', json={'books': [
+            {'title': 'Dune', 'author': 'Frank Herbert', 'rating': 10 ** 30},
+            {'title': 'Emma', 'author': 'Jane Austen', 'rating': 0},
+            {'title': 'Persuasion', 'author': 'Jane Austen', 'rating': 5}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([result.get('error') for result in data['results']], [400, 400, None])
+
+        res = self.client().patch('/books/ratings', json={'ratings': [
+            {'id': 1, 'rating': 10 ** 30},
+            {'id': 2, 'rating': 6},
+            {'id': 3, 'rating': '4'}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([result.get('error') for result in data['results']], [400, 400, None])
+        with self.app.app_context():
+            self.assertEqual([book.rating for book in Book.query.filter(Book.id <= 3).order_by(Book.id)], [2, 3, 4])
+
+    def test_400_empty_batch(self):
+        self.assertEqual(self.client().post('/books/batch', json={'books': []}).status_code, 400)
+        self.assertEqual(self.client().patch('/books/ratings', json={}).status_code, 400)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -73,11 +73,9 @@ class App extends Component {
 
   searchBooks = (search) => {
     $.ajax({
-      url: '/books', //TODO: update request URL
-      type: "POST",
+      url: `/books/search?q=${encodeURIComponent(search)}`,
+      type: "GET",
       dataType: 'json',
-      contentType: 'application/json',
-      data: JSON.stringify({search: search}),
       xhrFields: {
         withCredentials: true
       },
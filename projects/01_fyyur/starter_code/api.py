@@ -0,0 +1,251 @@
+#----------------------------------------------------------------------------#
+# JSON API
+#----------------------------------------------------------------------------#
+
+# A JSON surface over the same queries as the HTML pages, for the mobile
+# client. Every response carries a strong ETag computed from a cheap version
+# query (row counts, max(updated_at) and, for the listings, the counter sweep
+# watermark; for a single venue or artist, its next upcoming show, which is
+# when its page changes on its own). A matching If-None-Match gets a 304
+# before the payload is queried or serialized.
+
+import hashlib
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, abort
+
+from models import db, Venue, Artist, Show, CounterState, has_genre
+from database import read_only
+from params import encode_cursor, decode_cursor, requested_genre, requested_range, requested_limit
+import search
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+#  ----------------------------------------------------------------
+#  Versions
+#  ----------------------------------------------------------------
+
+def table_versions():
+  # one round trip: count and last update of every table, plus the counter
+  # sweep watermark, when num_upcoming_shows values change
+  def version(model):
+    return (
+      db.session.query(db.func.count(model.id)).scalar_subquery(),
+      db.session.query(db.func.max(model.updated_at)).scalar_subquery()
+    )
+  swept_until = db.session.query(db.func.max(CounterState.swept_until)).scalar_subquery()
+  return db.session.query(*version(Venue), *version(Artist), *version(Show), swept_until).one()
+
+def venue_version(venue_id, current_time):
+  # the venue row, its shows, the artists appearing on its page and its
+  # next show, when the past/upcoming split changes
+  return db.session.query(
+    Venue.updated_at,
+    db.func.count(Show.id),
+    db.func.max(Show.updated_at),
+    db.func.min(db.case((Show.start_time > current_time, Show.start_time))),
+    db.func.max(Artist.updated_at)
+  ).outerjoin(Show, Show.venue_id == Venue.id).outerjoin(
+    Artist, Artist.id == Show.artist_id
+  ).filter(Venue.id == venue_id).group_by(Venue.id).first()
+
+def artist_version(artist_id, current_time):
+  return db.session.query(
+    Artist.updated_at,
+    db.func.count(Show.id),
+    db.func.max(Show.updated_at),
+    db.func.min(db.case((Show.start_time > current_time, Show.start_time))),
+    db.func.max(Venue.updated_at)
+  ).outerjoin(Show, Show.artist_id == Artist.id).outerjoin(
+    Venue, Venue.id == Show.venue_id
+  ).filter(Artist.id == artist_id).group_by(Artist.id).first()
+
+def make_etag(*parts):
+  return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def conditional(etag, build):
+  # answers 304 when the client already has etag, otherwise serializes
+  # the payload returned by build()
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  return response
+
+def collection_etag():
+  return make_etag(request.full_path, table_versions())
+
+def isoformat(value):
+  return value.isoformat() if isinstance(value, datetime) else value
+
+def show_json(show):
+  return dict(show, start_time=isoformat(show['start_time']))
+
+#  ----------------------------------------------------------------
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@read_only
+def venues():
+  genre = requested_genre()
+  return conditional(
+    collection_etag(),
+    lambda: {'success': True, 'areas': list(Venue.areas(genre=genre))}
+  )
+
+@api.route('/venues/<int:venue_id>')
+@read_only
+def venue(venue_id):
+  current_time = datetime.utcnow()
+  version = venue_version(venue_id, current_time)
+  if version is None:
+    abort(404)
+
+  def build():
+    data = Venue.with_shows().filter_by(id=venue_id).first_or_404().page(current_time)
+    data['past_shows'] = list(map(show_json, data['past_shows']))
+    data['upcoming_shows'] = list(map(show_json, data['upcoming_shows']))
+    return {'success': True, 'venue': data}
+
+  return conditional(make_etag('venue', venue_id, version), build)
+
+#  ----------------------------------------------------------------
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@read_only
+def artists():
+  genre = requested_genre()
+
+  def build():
+    query = db.session.query(Artist.id, Artist.name)
+    if genre is not None:
+      query = query.filter(has_genre(Artist.genres, genre))
+    return {
+      'success': True,
+      'artists': [{'id': id, 'name': name} for id, name in query.order_by(Artist.id)]
+    }
+
+  return conditional(collection_etag(), build)
+
+@api.route('/artists/<int:artist_id>')
+@read_only
+def artist(artist_id):
+  current_time = datetime.utcnow()
+  version = artist_version(artist_id, current_time)
+  if version is None:
+    abort(404)
+
+  def build():
+    data = Artist.with_shows().filter_by(id=artist_id).first_or_404().page(current_time)
+    data['past_shows'] = list(map(show_json, data['past_shows']))
+    data['upcoming_shows'] = list(map(show_json, data['upcoming_shows']))
+    return {'success': True, 'artist': data}
+
+  return conditional(make_etag('artist', artist_id, version), build)
+
+#  ----------------------------------------------------------------
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@read_only
+def shows():
+  limit = requested_limit(current_app.config['SHOWS_PER_PAGE'], 100)
+  before = request.args.get('before')
+  if before is not None:
+    before = decode_cursor(before)
+
+  def build():
+    rows = Show.listing(limit + 1, before=before)
+    next_cursor = None
+    if len(rows) > limit:
+      rows = rows[:limit]
+      next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return {
+      'success': True,
+      'shows': [{
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+        'start_time': row.start_time.isoformat()
+      } for row in rows],
+      'next_cursor': next_cursor
+    }
+
+  return conditional(collection_etag(), build)
+
+#  ----------------------------------------------------------------
+#  Calendar
+#  ----------------------------------------------------------------
+
+# the widest ?start=&end= range, so a request stays proportional to the
+# shows it returns
+CALENDAR_MAX_DAYS = 92
+
+@api.route('/calendar')
+@read_only
+def calendar():
+  # /api/calendar?start=2030-05-02&end=2030-05-04&city=San Francisco&state=CA
+  # also venue_id, artist_id, genre, limit and the cursor of the last page
+  start, end = requested_range(CALENDAR_MAX_DAYS)
+  limit = requested_limit(current_app.config['SHOWS_PER_PAGE'], 100)
+  after = request.args.get('after')
+  if after is not None:
+    after = decode_cursor(after)
+  filters = {
+    'venue_id': request.args.get('venue_id', type=int),
+    'artist_id': request.args.get('artist_id', type=int),
+    'city': request.args.get('city'),
+    'state': request.args.get('state'),
+    'genre': requested_genre()
+  }
+
+  def build():
+    rows = Show.calendar(start, end, limit + 1, after=after, **filters)
+    next_cursor = None
+    if len(rows) > limit:
+      rows = rows[:limit]
+      next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return {
+      'success': True,
+      'shows': [{
+        'id': row.id,
+        'start_time': row.start_time.isoformat(),
+        'duration': row.duration,
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'city': row.city,
+        'state': row.state,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link
+      } for row in rows],
+      'next_cursor': next_cursor
+    }
+
+  return conditional(collection_etag(), build)
+
+#  ----------------------------------------------------------------
+#  Search
+#  ----------------------------------------------------------------
+
+@api.route('/search')
+@read_only
+def search_names():
+  kind = request.args.get('type', 'venues')
+  if kind not in ('venues', 'artists'):
+    abort(400)
+  model = Venue if kind == 'venues' else Artist
+  term = request.args.get('q', '')
+
+  def build():
+    results = search.find(model, term)
+    return {'success': True, 'count': len(results), 'data': results}
+
+  return conditional(collection_etag(), build)
@@ -2,6 +2,13 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+# Only what every worker needs is imported here. Flask-Migrate (alembic),
+# Flask-Moment and the WTForms forms are imported by the commands and routes
+# that use them, the first time they do, see benchmarks/bench_import.py.
+# babel is not deferred: CSRFProtect imports flask_wtf, which loads it.
+
+from datetime import datetime
+
 from flask import (
     Flask,
     render_template,
@@ -9,20 +16,56 @@ from flask import (
     Response,
     flash,
     redirect,
-    url_for
+    url_for,
+    abort,
+    jsonify,
+    stream_with_context
 )
-from flask_moment import Moment
-from flask_migrate import Migrate
-import logging
-from logging import Formatter, FileHandler
-from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect
-from forms import *
-from models import db, Venue, Artist, Show
-import json
-import dateutil.parser
-import babel
-import sys
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_MINUTES, has_genre, genre_facets
+from database import read_only
+from params import encode_cursor, decode_cursor, requested_genre
+import search
+from cache import PageCache
+from autocomplete import Autocomplete
+from importer import import_command
+from counters import counters_command
+from purge import purge_command
+from seed import seed_command
+from api import api
+from logs import init_logging
+from sqlprofiler import SQLProfiler
+from template_cache import init_template_caches
+from filters import format_datetime, format_datetimes
+
+#----------------------------------------------------------------------------#
+# Deferred extensions
+#----------------------------------------------------------------------------#
+
+def lazy_extension(app, name, load):
+  '''
+  lazy_extension(app, name, load)
+      app.extensions[name] is set up by load(app) the first time it is
+      used, instead of when the app is created
+  '''
+  def extension():
+    if app.extensions.get(name) is proxy:
+      load(app)
+    return app.extensions[name]
+  proxy = LocalProxy(extension)
+  app.extensions[name] = proxy
+
+def load_migrate(app):
+  # only the `flask db` commands need alembic
+  from flask_migrate import Migrate
+  Migrate(app, db)
+
+def load_moment(app):
+  # what Moment.init_app registers; the context processor itself is added
+  # up front, as setup methods cannot run once requests are served
+  app.extensions['moment'] = import_string('flask_moment:_moment')
 
 #----------------------------------------------------------------------------#
 # App Config
@@ -30,439 +73,525 @@ import sys
 
 csrf = CSRFProtect()
 
-app = Flask(__name__)
-app.config.from_object('config')
-csrf.init_app(app)
-csrf = CSRFProtect(app)
-moment = Moment(app)
-db.init_app(app)
-migrate = Migrate(app, db)
+def create_app(test_config=None):
+  # create and configure the app
+  app = Flask(__name__)
+  app.config.from_object('config')
+  if test_config is not None:
+    app.config.update(test_config)
+  csrf.init_app(app)
+  lazy_extension(app, 'moment', load_moment)
+  app.context_processor(lambda: {'moment': app.extensions['moment']})
+  db.init_app(app)
+  lazy_extension(app, 'migrate', load_migrate)
+  page_cache = PageCache.from_config(app.config)
+  autocomplete = Autocomplete.from_config(app.config)
+  fragment_cache = init_template_caches(app)
+  app.extensions.update(page_cache=page_cache, autocomplete=autocomplete, fragment_cache=fragment_cache)
+  app.cli.add_command(import_command)
+  app.cli.add_command(seed_command)
+  app.cli.add_command(counters_command)
+  app.cli.add_command(purge_command)
+  app.register_blueprint(api)
+  app.extensions['log_listener'] = init_logging(app)
+  SQLProfiler(app)
+  if app.config.get('AUTOCOMPLETE_BUILD_AT_START', True):
+    autocomplete.start(app)
+
+  # TODO: connect to a local postgresql database
+  # DONE - see config info in config.py file
+
+  #  ----------------------------------------------------------------
+  #  Filters
+  #  ----------------------------------------------------------------
+
+  app.jinja_env.filters['datetime'] = format_datetime
+
+  def stream_template(template_name, **context):
+    # renders the template chunk by chunk instead of into one big string
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(5)
+    return Response(stream_with_context(stream))
+
+  #  ----------------------------------------------------------------
+  #  Controllers
+  #  ----------------------------------------------------------------
+
+  @app.route('/')
+  def index():
+    return render_template('pages/home.html')
+
+  #  ----------------------------------------------------------------
+  #  Venues
+  #  ----------------------------------------------------------------
+
+  @app.route('/venues')
+  def venues():
+    # TODO: replace with real venues data.
+    # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
+
+    # DONE - a single query over the maintained counters, see Venue.areas
+
+    # reads the primary: the page fills the venue areas fragment, which a
+    # write has often just invalidated, see show_venue
+
+    genre = requested_genre()
+    data = Venue.areas(genre=genre)
+
+    return render_template('pages/venues.html', areas=data, genre=genre)
+
+  @app.route('/venues/search', methods=['POST'])
+  @read_only
+  def search_venues():
+    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+    # search for "Hop" should return "The Musical Hop".
+    # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+    # DONE
+
+    search_term=request.form.get('search_term', '')
+    venues = search.find(Venue, search_term)
+    response={
+      "count": len(venues),
+      "data": venues
+    }
+    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+  @app.route('/venues/<int:venue_id>')
+  def show_venue(venue_id):
+    # shows the venue page with the given venue_id
+    # TODO: replace with real venue data from the venues table, using venue_id
+    # DONE
+
+    # reads the primary: a page cache miss often follows an invalidation,
+    # which a lagging replica would undo
+
+    def load():
+      venue = Venue.with_shows().filter_by(id=venue_id).first_or_404()
+      return venue.page(datetime.utcnow())
+
+    data = page_cache.get_or_load('venue', venue_id, load)
+
+    return render_template('pages/show_venue.html', venue=data)
+
+  #  ----------------------------------------------------------------
+  #  Create Venue
+  #  ----------------------------------------------------------------
+
+  @app.route('/venues/create', methods=['GET'])
+  def create_venue_form():
+    from forms import VenueForm
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+  @app.route('/venues/create', methods=['POST'])
+  def create_venue_submission():
+    from forms import VenueForm
+    form = VenueForm(request.form, meta={'csrf': False})
+    if form.validate():
+      try:
+          new_venue = Venue()
+          form.populate_obj(new_venue)
+          db.session.add(new_venue)
+          db.session.commit()
+          page_cache.invalidate('venue', new_venue.id)
+          autocomplete.put(Venue, new_venue.id, form.name.data)
+          flash('Venue ' + request.form['name'] + ' was successfully listed!')
+      except Exception as error:
+          flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
+          db.session.rollback()
+      finally:
+          db.session.close()
+    else:
+        message = []
+        for field, err in form.errors.items():
+          message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+    return render_template('pages/home.html')
+
+  @app.route('/venues/<int:venue_id>/delete', methods=['POST'])
+  def delete_venue(venue_id):
+    # TODO: Complete this endpoint for taking a venue_id, and using
+    # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+    # DONE - the venue is hidden at once, `flask purge` removes its shows
+    # and then the venue in the background, see purge.py
+    try:
+      Venue.soft_delete(venue_id)
+      # the pages of its artists list its shows
+      artist_ids = [id for id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+      db.session.commit()
+      page_cache.invalidate('venue', venue_id)
+      for artist_id in artist_ids:
+        page_cache.invalidate('artist', artist_id)
+      autocomplete.remove(Venue, venue_id)
+      flash('Venue with id ' + str(venue_id) + ' was successfully deleted!')
+    except:
+      db.session.rollback()
+      flash('An error occurred. Venue with id = ' + str(venue_id) + ' could not be deleted.')
+    finally:
+      db.session.close()
 
+    # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
+    # clicking that button delete it from the db then redirect the user to the homepage
+    # DONE - I tried a different url structure than the one suggested in the code and it works. :)
+
+    return render_template('pages/home.html')
+
+  #  ----------------------------------------------------------------
+  #  Artists
+  #  ----------------------------------------------------------------
+  @app.route('/artists')
+  def artists():
+    # TODO: replace with real data returned from querying the database
+    # DONE
+
+    # reads the primary, see venues
+
+    genre = requested_genre()
+    query = Artist.query
+    if genre is not None:
+      query = query.filter(has_genre(Artist.genres, genre))
+    # not run here: the template only iterates it when the cached fragment
+    # has expired
+    data = query.order_by('id')
+    return render_template('pages/artists.html', artists=data, genre=genre)
+
+  @app.route('/genres')
+  @read_only
+  def genres():
+    # number of venues and artists per genre, for the genre browser
+    return jsonify(genre_facets())
+
+  @app.route('/artists/search', methods=['POST'])
+  @read_only
+  def search_artists():
+    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+    # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+    # search for "band" should return "The Wild Sax Band".
+    # DONE
+
+    search_term=request.form.get('search_term', '')
+    artists = search.find(Artist, search_term)
+    response={
+        "count": len(artists),
+        "data": artists
+      }
+    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+
+  @app.route('/artists/<int:artist_id>')
+  def show_artist(artist_id):
+    # shows the artist page with the given artist_id
+    # TODO: replace with real artist data from the artist table, using artist_id
+    # DONE
+
+    # reads the primary, see show_venue
+
+    def load():
+      artist = Artist.with_shows().filter_by(id=artist_id).first_or_404()
+      return artist.page(datetime.utcnow())
+
+    data = page_cache.get_or_load('artist', artist_id, load)
+
+    return render_template('pages/show_artist.html', artist=data)
+
+  @app.route('/artists/<int:artist_id>/delete', methods=['POST'])
+  def delete_artist(artist_id):
+    # same as delete_venue
+    try:
+      Artist.soft_delete(artist_id)
+      venue_ids = [id for id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+      db.session.commit()
+      page_cache.invalidate('artist', artist_id)
+      for venue_id in venue_ids:
+        page_cache.invalidate('venue', venue_id)
+      autocomplete.remove(Artist, artist_id)
+      flash('Artist with id ' + str(artist_id) + ' was successfully deleted!')
+    except:
+      db.session.rollback()
+      flash('An error occurred. Artist with id = ' + str(artist_id) + ' could not be deleted.')
+    finally:
+      db.session.close()
 
-# TODO: connect to a local postgresql database
-# DONE - see config info in config.py file
+    return render_template('pages/home.html')
 
-#----------------------------------------------------------------------------#
-# Filters
-#----------------------------------------------------------------------------#
+  #  ----------------------------------------------------------------
+  #  Update
+  #  ----------------------------------------------------------------
 
-def format_datetime(value, format='medium'):
-  if isinstance(value, str):
-      date = dateutil.parser.parse(value)
-  else:
-      date = value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+  @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+  def edit_artist(artist_id):
 
-app.jinja_env.filters['datetime'] = format_datetime
+    artist = Artist.query.filter_by(id=artist_id).all()[0]
 
-#----------------------------------------------------------------------------#
-# Controllers
-#----------------------------------------------------------------------------#
+    from forms import ArtistForm
+    form = ArtistForm(
+      name=artist.name,
+      city=artist.city,
+      state=artist.state,
+      genres=artist.genres,
+      phone=artist.phone,
+      facebook_link=artist.facebook_link,
+      website_link=artist.website_link,
+      image_link=artist.image_link,
+      looking_for_venue=artist.looking_for_venue,
+      seeking_description=artist.seeking_description
+    )
+
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+  @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+  def edit_artist_submission(artist_id):
 
-@app.route('/')
-def index():
-  return render_template('pages/home.html')
-
-#  ----------------------------------------------------------------
-#  Venues
-#  ----------------------------------------------------------------
-
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data.
-  # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-
-  current_time = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-  venues = Venue.query.order_by('city').all()
-  venue_state_and_city = ''
-  data = []
-
-  #loop through venues to check for upcoming shows, city, states and venue information
-
-  for venue in venues:
-  # filter upcoming shows given that the show start time is greater than the current time
-  # print(venue)
-    upcoming_shows = Show.query.filter(Show.start_time > current_time, Show.venue_id == venue.id).all()
-    if venue_state_and_city == venue.city + venue.state:
-      data[len(data) - 1]["venues"].append({
-        "id": venue.id,
-        "name":venue.name,
-        "num_upcoming_shows": len(upcoming_shows) # a count of the number of shows
-      })
-    else:
-      venue_state_and_city = venue.city + venue.state
-
-      data.append({
-        "city":venue.city,
-        "state":venue.state,
-        "venues": [{
-          "id": venue.id,
-          "name":venue.name,
-          "num_upcoming_shows": len(upcoming_shows)
-        }]
-      })
-
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # search for "Hop" should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  # DONE
-
-  search_term=request.form.get('search_term', '')
-  current_time = datetime.utcnow()
-  venues = Venue.query.filter(Venue.name.ilike('%'+search_term+'%')).all()
-  response={
-    "count": len(venues),
-    "data":[]
-  }
-  for venue in venues:
-    response['data'].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(Venue.query.join(Show).filter(venue.id == Show.venue_id,Show.start_time > current_time).all()),
-    })
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  # DONE
-
-  current_time = datetime.utcnow()
-  venue_query = Venue.query.filter_by(id=venue_id).all()
-  data = list(map(Venue.details, venue_query))[0]
-  past_shows = Show.query.join(Venue).join(Artist).filter(venue_id == Show.venue_id,Show.start_time <= current_time).all()
-  upcoming_shows = Show.query.join(Venue).join(Artist).filter(venue_id == Show.venue_id,Show.start_time > current_time).all()
-  data['past_shows'] = list(map(Show.artist_show, past_shows))
-  data['upcoming_shows'] = list(map(Show.artist_show, upcoming_shows))
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-
-  print(data)
-  return render_template('pages/show_venue.html', venue=data)
-
-#  ----------------------------------------------------------------
-#  Create Venue
-#  ----------------------------------------------------------------
-
-@app.route('/venues/create', methods=['GET'])
-def create_venue_form():
-  form = VenueForm()
-  return render_template('forms/new_venue.html', form=form)
-
-@app.route('/venues/create', methods=['POST'])
-def create_venue_submission():
-  form = VenueForm(request.form, meta={'csrf': False})
-  if form.validate():
     try:
-        new_venue = Venue()
-        form.populate_obj(new_venue)
-        db.session.add(new_venue)
-        db.session.commit()
-        flash('Venue ' + request.form['name'] + ' was successfully listed!')
-    except Exception as error:
-        flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
-        db.session.rollback()
+      artist = Artist.query.filter_by(id=artist_id).all()[0]
+      artist.name=request.form.get('name')
+      artist.city=request.form.get('city')
+      artist.state=request.form.get('state')
+      artist.phone=request.form.get('phone')
+      artist.genres=request.form.getlist('genres')
+      artist.facebook_link=request.form.get('facebook_link')
+      artist.website_link=request.form.get('website_link')
+      artist.image_link=request.form.get('image_link')
+      artist.looking_for_venue = 'looking_for_venue' in request.form # This was hard for me to get, but I made it! :)
+      artist.seeking_description=request.form.get('seeking_description')
+      # the pages of its venues show its name and image
+      venue_ids = [id for id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+      db.session.commit()
+      page_cache.invalidate('artist', artist_id)
+      for venue_id in venue_ids:
+        page_cache.invalidate('venue', venue_id)
+      autocomplete.put(Artist, artist_id, request.form.get('name'))
+    except:
+      db.session.rollback()
+      flash('An error occurred. Artist could not be updated.')
     finally:
-        db.session.close()
-  else:
-      message = []
-      for field, err in form.errors.items():
-        message.append(field + ' ' + '|'.join(err))
-      flash('Errors ' + str(message))
-  return render_template('pages/home.html')
-
-@app.route('/venues/<int:venue_id>/delete', methods=['GET'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  try:
-    Venue.query.filter_by(id=venue_id).delete()
-    db.session.commit()
-    flash('Venue with id ' + str(venue_id) + ' was successfully deleted!')
-  except:
-    db.session.rollback()
-    flash('An error occurred. Venue with id = ' + str(venue_id) + ' could not be deleted.')
-  finally:
-    db.session.close()
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  # DONE - I tried a different url structure than the one suggested in the code and it works. :)
-
-  return render_template('pages/home.html')
-
-#  ----------------------------------------------------------------
-#  Artists
-#  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-  # TODO: replace with real data returned from querying the database
-  # DONE
-
-  data = Artist.query.order_by('id').all()
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  # DONE
-
-  search_term=request.form.get('search_term', '')
-  current_time = datetime.utcnow()
-  artists = Artist.query.filter(Artist.name.ilike('%'+search_term+'%')).all()
-  response={
-      "count": len(artists),
-      "data":[]
-    }
-  for artist in artists:
-    response['data'].append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(Artist.query.join(Show).filter(artist.id == Show.artist_id, Show.start_time > current_time).all())
-    })
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  # DONE
-
-  current_time = datetime.utcnow()
-  artist_query = Artist.query.filter_by(id=artist_id).all()
-  data = list(map(Artist.details, artist_query))[0]
-  past_shows = Show.query.join(Venue).join(Artist).filter(artist_id == Show.artist_id,Show.start_time <= current_time).all()
-  upcoming_shows = Show.query.join(Venue).join(Artist).filter(artist_id == Show.artist_id,Show.start_time > current_time).all()
-  data['past_shows'] = list(map(Show.venue_show, past_shows))
-  data['upcoming_shows'] = list(map(Show.venue_show, upcoming_shows))
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-
-  return render_template('pages/show_artist.html', artist=data)
-
-#  ----------------------------------------------------------------
-#  Update
-#  ----------------------------------------------------------------
-
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-
-  artist = Artist.query.filter_by(id=artist_id).all()[0]
-
-  form = ArtistForm(
-    name=artist.name,
-    city=artist.city,
-    state=artist.state,
-    genres=artist.genres,
-    phone=artist.phone,
-    facebook_link=artist.facebook_link,
-    website_link=artist.website_link,
-    image_link=artist.image_link,
-    looking_for_venue=artist.looking_for_venue,
-    seeking_description=artist.seeking_description
-  )
-
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
-
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
-def edit_artist_submission(artist_id):
-
-  try:
-    artist = Artist.query.filter_by(id=artist_id).all()[0]
-    artist.name=request.form.get('name')
-    artist.city=request.form.get('city')
-    artist.state=request.form.get('state')
-    artist.phone=request.form.get('phone')
-    artist.genres=request.form.getlist('genres')
-    artist.facebook_link=request.form.get('facebook_link')
-    artist.website_link=request.form.get('website_link')
-    artist.image_link=request.form.get('image_link')
-    artist.looking_for_venue = 'looking_for_venue' in request.form # This was hard for me to get, but I made it! :)
-    artist.seeking_description=request.form.get('seeking_description')
-    db.session.commit()
-  except:
-    db.session.rollback()
-    flash('An error occurred. Artist could not be updated.')
-  finally:
-    db.session.close()
-
-  return redirect(url_for('show_artist', artist_id=artist_id))
-
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
-def edit_venue(venue_id):
-
-  venue = Venue.query.filter_by(id=venue_id).all()[0]
-
-  form = VenueForm(
-    name=venue.name,
-    city=venue.city,
-    state=venue.state,
-    address=venue.address,
-    phone=venue.phone,
-    genres=venue.genres,
-    facebook_link=venue.facebook_link,
-    website_link=venue.website_link,
-    image_link=venue.image_link,
-    looking_for_talent=venue.looking_for_talent,
-    seeking_description=venue.seeking_description
-  )
-
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
-
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(venue_id):
-
-  try:
+      db.session.close()
+
+    return redirect(url_for('show_artist', artist_id=artist_id))
+
+  @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+  def edit_venue(venue_id):
+
     venue = Venue.query.filter_by(id=venue_id).all()[0]
 
-    venue.name=request.form.get('name')
-    venue.city=request.form.get('city')
-    venue.state=request.form.get('state')
-    venue.address=request.form.get('address')
-    venue.phone=request.form.get('phone')
-    venue.genres=request.form.getlist('genres')
-    venue.facebook_link=request.form.get('facebook_link')
-    venue.website_link=request.form.get('website_link')
-    venue.image_link=request.form.get('image_link')
-    venue.seeking_description=request.form.get('seeking_description')
-    venue.looking_for_talent = 'looking_for_talent' in request.form
-
-    db.session.commit()
-  except:
-    db.session.rollback()
-    flash('An error occurred. Venue could not be updated')
-  finally:
-    db.session.close()
-
-  return redirect(url_for('show_venue', venue_id=venue_id))
-
-#  ----------------------------------------------------------------
-#  Create Artist
-#  ----------------------------------------------------------------
-
-@app.route('/artists/create', methods=['GET'])
-def create_artist_form():
-  form = ArtistForm()
-  return render_template('forms/new_artist.html', form=form)
-
-@app.route('/artists/create', methods=['POST'])
-def create_artist_submission():
-  form = ArtistForm(request.form, meta={'csrf': False})
-  if form.validate():
-    try:
-        new_artist = Artist()
-        form.populate_obj(new_artist)
-        db.session.add(new_artist)
-        db.session.commit()
-        flash('Artist ' + request.form['name'] + ' was successfully listed!')
-    except Exception as error:
-        flash('An error occurred. Artist ' + new_artist.name + ' could not be listed.')
-        db.session.rollback()
-    finally:
-        db.session.close()
-  else:
-      message = []
-      for field, err in form.errors.items():
-        message.append(field + ' ' + '|'.join(err))
-      flash('Errors ' + str(message))
-  return render_template('pages/home.html')
-
-#  ----------------------------------------------------------------
-#  Shows
-#  ----------------------------------------------------------------
-
-@app.route('/shows')
-def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  # DONE
-
-  shows = Show.query.order_by(db.desc(Show.start_time))
-
-  data = []
-
-  for show in shows:
-    data.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time))
-    })
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
-def create_shows():
-  # renders form. do not touch.
-  form = ShowForm()
-  return render_template('forms/new_show.html', form=form)
-
-@app.route('/shows/create', methods=['POST'])
-def create_show_submission():
-
-  # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-  # DONE
-
-  form = ShowForm(request.form)
-  flash(form.errors)
-  if form.validate():
-    try:
-      new_show = Show(
-                start_time=form.start_time.data,
-                venue_id=form.venue_id.data,
-                artist_id=form.artist_id.data
-            )
-      db.session.add(new_show)
-      db.session.commit()
+    from forms import VenueForm
+    form = VenueForm(
+      name=venue.name,
+      city=venue.city,
+      state=venue.state,
+      address=venue.address,
+      phone=venue.phone,
+      genres=venue.genres,
+      facebook_link=venue.facebook_link,
+      website_link=venue.website_link,
+      image_link=venue.image_link,
+      looking_for_talent=venue.looking_for_talent,
+      seeking_description=venue.seeking_description
+    )
 
-      # on successful db insert, flash success
-      flash('Show was successfully listed!')
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-    except Exception as error:
-      # TODO: on unsuccessful db insert, flash an error instead.
-      flash('An error occurred. The show could not be listed.')
-      db.session.rollback()
-      flash(error)
+  @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+  def edit_venue_submission(venue_id):
 
+    try:
+      venue = Venue.query.filter_by(id=venue_id).all()[0]
+
+      venue.name=request.form.get('name')
+      venue.city=request.form.get('city')
+      venue.state=request.form.get('state')
+      venue.address=request.form.get('address')
+      venue.phone=request.form.get('phone')
+      venue.genres=request.form.getlist('genres')
+      venue.facebook_link=request.form.get('facebook_link')
+      venue.website_link=request.form.get('website_link')
+      venue.image_link=request.form.get('image_link')
+      venue.seeking_description=request.form.get('seeking_description')
+      venue.looking_for_talent = 'looking_for_talent' in request.form
+      # the pages of its artists show its name and image
+      artist_ids = [id for id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+
+      db.session.commit()
+      page_cache.invalidate('venue', venue_id)
+      for artist_id in artist_ids:
+        page_cache.invalidate('artist', artist_id)
+      autocomplete.put(Venue, venue_id, request.form.get('name'))
+    except:
+      db.session.rollback()
+      flash('An error occurred. Venue could not be updated')
     finally:
       db.session.close()
 
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
-
-@app.errorhandler(404)
-def not_found_error(error):
-    return render_template('errors/404.html'), 404
+    return redirect(url_for('show_venue', venue_id=venue_id))
+
+  #  ----------------------------------------------------------------
+  #  Create Artist
+  #  ----------------------------------------------------------------
+
+  @app.route('/artists/create', methods=['GET'])
+  def create_artist_form():
+    from forms import ArtistForm
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+  @app.route('/artists/create', methods=['POST'])
+  def create_artist_submission():
+    from forms import ArtistForm
+    form = ArtistForm(request.form, meta={'csrf': False})
+    if form.validate():
+      try:
+          new_artist = Artist()
+          form.populate_obj(new_artist)
+          db.session.add(new_artist)
+          db.session.commit()
+          page_cache.invalidate('artist', new_artist.id)
+          autocomplete.put(Artist, new_artist.id, form.name.data)
+          flash('Artist ' + request.form['name'] + ' was successfully listed!')
+      except Exception as error:
+          flash('An error occurred. Artist ' + new_artist.name + ' could not be listed.')
+          db.session.rollback()
+      finally:
+          db.session.close()
+    else:
+        message = []
+        for field, err in form.errors.items():
+          message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+    return render_template('pages/home.html')
+
+  #  ----------------------------------------------------------------
+  #  Shows
+  #  ----------------------------------------------------------------
+
+  @app.route('/shows')
+  @read_only
+  def shows():
+    # displays list of shows at /shows
+    # TODO: replace with real venues data.
+    #       num_shows should be aggregated based on number of upcoming shows per venue.
+    # DONE
+
+    # DONE - keyset pagination on (start_time, id), see Show.listing
+
+    limit = app.config['SHOWS_PER_PAGE']
+    before = request.args.get('before')
+    if before is not None:
+      before = decode_cursor(before)
+
+    # fetch one extra row to know whether there is a next page
+    rows = Show.listing(limit + 1, before=before)
+    next_cursor = None
+    if len(rows) > limit:
+      rows = rows[:limit]
+      next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+
+    start_times = format_datetimes([row.start_time for row in rows], 'full')
+    data = ({
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": start_time
+    } for row, start_time in zip(rows, start_times))
+    return stream_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+  @app.route('/shows/create')
+  def create_shows():
+    # renders form. do not touch.
+    from forms import ShowForm
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+  @app.route('/shows/create', methods=['POST'])
+  def create_show_submission():
+
+    # called to create new shows in the db, upon submitting new show listing form
+    # TODO: insert form data as a new Show record in the db, instead
+    # DONE
+
+    from forms import ShowForm
+    form = ShowForm(request.form)
+    flash(form.errors)
+    if form.validate():
+      try:
+        duration = form.duration.data or DEFAULT_SHOW_MINUTES
+        # locks the venue and the artist until the commit, see Show.booking_errors
+        errors = Show.booking_errors(form.venue_id.data, form.artist_id.data, form.start_time.data, duration)
+        if errors:
+          db.session.rollback()
+          flash('The show could not be listed. ' + ' '.join(message for messages in errors.values() for message in messages))
+          return render_template('pages/home.html')
+        new_show = Show(
+                  start_time=form.start_time.data,
+                  venue_id=form.venue_id.data,
+                  artist_id=form.artist_id.data,
+                  duration=duration
+              )
+        db.session.add(new_show)
+        db.session.commit()
+        page_cache.invalidate('venue', new_show.venue_id)
+        page_cache.invalidate('artist', new_show.artist_id)
+        if form.start_time.data > datetime.utcnow():
+          autocomplete.adjust(Venue, form.venue_id.data, 1)
+          autocomplete.adjust(Artist, form.artist_id.data, 1)
+
+        # on successful db insert, flash success
+        flash('Show was successfully listed!')
+
+      except Exception as error:
+        # TODO: on unsuccessful db insert, flash an error instead.
+        flash('An error occurred. The show could not be listed.')
+        db.session.rollback()
+        flash(error)
 
-@app.errorhandler(500)
-def server_error(error):
-    return render_template('errors/500.html'), 500
+      finally:
+        db.session.close()
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    # TODO: on unsuccessful db insert, flash an error instead.
+    # e.g., flash('An error occurred. Show could not be listed.')
+    # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+    return render_template('pages/home.html')
+
+  #  ----------------------------------------------------------------
+  #  Autocomplete
+  #  ----------------------------------------------------------------
+
+  @app.route('/autocomplete')
+  @read_only
+  def autocomplete_names():
+    # per keystroke suggestions from the in-memory index, see autocomplete.py
+    kind = request.args.get('type', 'venues')
+    if kind not in ('venues', 'artists'):
+      abort(400)
+    limit = request.args.get('limit', None, type=int)
+    if limit is not None and limit < 1:
+      abort(400)
+    results = autocomplete.search(Venue if kind == 'venues' else Artist, request.args.get('q', ''), limit)
+    return jsonify({'success': True, 'count': len(results), 'data': results})
+
+  #  ----------------------------------------------------------------
+  #  Cache
+  #  ----------------------------------------------------------------
+
+  @app.route('/cache/stats')
+  def cache_stats():
+    return jsonify(page_cache.stats())
+
+  @app.route('/db/stats')
+  def db_stats():
+    return jsonify(db.pool_stats())
+
+  @app.errorhandler(404)
+  def not_found_error(error):
+      return render_template('errors/404.html'), 404
+
+  @app.errorhandler(500)
+  def server_error(error):
+      return render_template('errors/500.html'), 500
+
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch
@@ -470,11 +599,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,291 @@
+#----------------------------------------------------------------------------#
+# Autocomplete
+#----------------------------------------------------------------------------#
+
+# Name suggestions for the search boxes, served from memory instead of an
+# ilike per keystroke.
+#
+# Each table has a PrefixIndex: a sorted array of (key, id) pairs with one key
+# per word of the name ("the musical hop", "musical hop", "hop"), so a prefix
+# of any word finds the name with a binary search. Matches are ranked by
+# popularity, the upcoming show counter, and the top results of each prefix
+# are kept in a small LRU so the next keystroke of another user is a lookup.
+#
+# The index is built from the database in a background thread started by
+# create_app (AUTOCOMPLETE_BUILD_AT_START), so no request waits for it; until
+# it is done the suggestions are empty. The create, edit and delete handlers
+# update it after their commit; everything else (imports, seeds, counter
+# sweeps, and the writes handled by the other workers) is picked up by a
+# rebuild in the same background thread once the index is older than
+# AUTOCOMPLETE_REBUILD_INTERVAL seconds.
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from flask import current_app
+
+from models import db, Venue, Artist
+
+
+def normalize(text):
+    return ' '.join(str(text).casefold().split())
+
+
+def keys(name):
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+    '''
+    PrefixIndex(max_results, cache_size)
+        names of one table by word prefix, returning at most max_results
+        (id, name, popularity) matches, most popular first; thread safe
+    '''
+    # prefixes this short match a large share of the names; their results
+    # are computed by the build instead of the first keystroke
+    WARM_LENGTH = 2
+
+    def __init__(self, max_results=20, cache_size=4096):
+        self.max_results = max_results
+        self.cache_size = cache_size
+        # results kept per prefix, so a few removals need no new scan
+        self.depth = 2 * max_results
+        self._keys = []
+        self._entries = {}
+        self._top = OrderedDict()
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def build(self, rows):
+        # rows of (id, name, popularity); the arrays are built outside the
+        # lock, changes made in the meantime are replayed on the new ones
+        built = None
+        try:
+            entries = {id: (name, popularity or 0) for id, name, popularity in rows}
+            pairs = sorted((key, id) for id, (name, popularity) in entries.items() for key in keys(name))
+            warm = {}
+            for key, id in pairs:
+                for end in range(1, min(len(key), self.WARM_LENGTH) + 1):
+                    warm.setdefault(key[:end], set()).add(id)
+            built = pairs, entries, OrderedDict(
+                (prefix, self._ranked(ids, entries)) for prefix, ids in warm.items())
+        finally:
+            # a failed build (rows read from the database) keeps the current
+            # arrays, which the recorded changes were already made on
+            with self._lock:
+                pending, self._pending = self._pending or [], None
+                if built is not None:
+                    self._keys, self._entries, self._top = built
+                    for change in pending:
+                        change()
+
+    def start_build(self):
+        # changes until the next build() are recorded to be replayed on it
+        with self._lock:
+            self._pending = []
+
+    def search(self, prefix, limit=None):
+        prefix = normalize(prefix)
+        limit = min(limit or self.max_results, self.max_results)
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._top[prefix] = self._scan(prefix)
+                if len(self._top) > self.cache_size:
+                    self._top.popitem(last=False)
+            else:
+                self._top.move_to_end(prefix)
+            return [(id,) + self._entries[id] for id in top[0][:limit]]
+
+    def _rank(self, id, entries=None):
+        name, popularity = (entries or self._entries)[id]
+        return -popularity, name.casefold(), id
+
+    def _ranked(self, ids, entries):
+        # (the best depth ids, whether they are all the matches)
+        ranked = heapq.nsmallest(self.depth, ids, key=lambda id: self._rank(id, entries))
+        return ranked, len(ranked) == len(ids)
+
+    def _scan(self, prefix):
+        # every key starting with prefix sits in one run of the sorted array
+        ids = set()
+        index = bisect_left(self._keys, (prefix,))
+        while index < len(self._keys) and self._keys[index][0].startswith(prefix):
+            ids.add(self._keys[index][1])
+            index += 1
+        return self._ranked(ids, self._entries)
+
+    def put(self, id, name, popularity=None):
+        # adds or renames id; popularity None keeps the current one
+        with self._lock:
+            self._put(id, name, popularity)
+            if self._pending is not None:
+                self._pending.append(lambda: self._put(id, name, popularity))
+
+    def remove(self, id):
+        with self._lock:
+            self._remove(id)
+            if self._pending is not None:
+                self._pending.append(lambda: self._remove(id))
+
+    def adjust(self, id, delta):
+        # not replayed by a build: a delta is not idempotent, and rows read
+        # after the commit already count it; the next build catches up
+        with self._lock:
+            self._adjust(id, delta)
+
+    def _put(self, id, name, popularity):
+        current = self._entries.get(id)
+        if popularity is None:
+            popularity = current[1] if current else 0
+        if current:
+            self._remove(id)
+        self._entries[id] = (name, popularity)
+        for key in keys(name):
+            insort(self._keys, (key, id))
+        self._promote(id)
+
+    def _remove(self, id):
+        current = self._entries.get(id)
+        if current is None:
+            return
+        self._demote(id, removed=True)
+        del self._entries[id]
+        for key in keys(current[0]):
+            index = bisect_left(self._keys, (key, id))
+            if index < len(self._keys) and self._keys[index] == (key, id):
+                del self._keys[index]
+
+    def _adjust(self, id, delta):
+        current = self._entries.get(id)
+        if current is None or not delta:
+            return
+        if delta < 0:
+            self._demote(id)
+        self._entries[id] = (current[0], current[1] + delta)
+        self._promote(id)
+
+    def _cached(self, id):
+        # the cached results of the prefixes matching id
+        prefixes = {key[:end] for key in keys(self._entries[id][0]) for end in range(1, len(key) + 1)}
+        return [(prefix, self._top[prefix]) for prefix in prefixes if prefix in self._top]
+
+    def _promote(self, id):
+        # id is new or ranks higher: insert it where it belongs; below the
+        # last of a partial list it is behind everything that list returns
+        rank = self._rank(id)
+        for prefix, (ids, complete) in self._cached(id):
+            if id in ids:
+                ids.remove(id)
+            elif not complete and ids and rank > self._rank(ids[-1]):
+                continue
+            ids.append(id)
+            ids.sort(key=self._rank)
+            if len(ids) > self.depth:
+                del ids[self.depth:]
+                complete = False
+            self._top[prefix] = (ids, complete)
+
+    def _demote(self, id, removed=False):
+        # id goes away or ranks lower: take it out of the partial lists, and
+        # scan again once one runs shorter than max_results
+        for prefix, (ids, complete) in self._cached(id):
+            if id not in ids or (complete and not removed):
+                continue
+            ids.remove(id)
+            if not complete and len(ids) < self.max_results:
+                del self._top[prefix]
+
+
+class Autocomplete:
+    '''
+    Autocomplete(max_results, cache_size, rebuild_interval)
+        a PrefixIndex for venues and one for artists, built from the
+        database in the background by start(app) and rebuilt there every
+        rebuild_interval seconds (never when None)
+    '''
+    MODELS = (Venue, Artist)
+
+    def __init__(self, max_results=20, cache_size=4096, rebuild_interval=300):
+        self.rebuild_interval = rebuild_interval
+        self.indexes = {model: PrefixIndex(max_results, cache_size) for model in self.MODELS}
+        self.built_at = None
+        self._rebuilding = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get('AUTOCOMPLETE_MAX_RESULTS', 20),
+            config.get('AUTOCOMPLETE_CACHE_SIZE', 4096),
+            config.get('AUTOCOMPLETE_REBUILD_INTERVAL', 300)
+        )
+
+    def build(self):
+        # needs an app context
+        for model, index in self.indexes.items():
+            index.start_build()
+            index.build(db.session.query(model.id, model.name, model.upcoming_shows_count))
+        self.built_at = time.monotonic()
+
+    def start(self, app):
+        '''
+        start(app)
+            builds the indexes from the database of app in a background
+            thread, unless one is already running; returns that thread
+        '''
+        with self._lock:
+            if self._rebuilding is not None:
+                return self._rebuilding
+            thread = self._rebuilding = threading.Thread(
+                target=self._rebuild, args=(app,), name='autocomplete-rebuild', daemon=True)
+            thread.start()
+        return thread
+
+    def search(self, model, prefix, limit=None):
+        '''
+        search(model, prefix, limit)
+            returns the id, name and number of upcoming shows of the most
+            popular Venues or Artists with a word starting with prefix
+        '''
+        # never built (the first build failed or was not started) or stale:
+        # this request is answered from the current index all the same
+        if self.built_at is None or (
+                self.rebuild_interval is not None and time.monotonic() - self.built_at > self.rebuild_interval):
+            self.start(current_app._get_current_object())
+        return [{
+            'id': id,
+            'name': name,
+            'num_upcoming_shows': popularity
+        } for id, name, popularity in self.indexes[model].search(prefix, limit)]
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                self.build()
+        except Exception:
+            app.logger.exception('Autocomplete rebuild failed')
+        finally:
+            with self._lock:
+                self._rebuilding = None
+
+    # called by the handlers after their commit; a build running meanwhile
+    # replays the puts and removes on its new arrays
+
+    def put(self, model, id, name, popularity=None):
+        self.indexes[model].put(id, name, popularity)
+
+    def remove(self, model, id):
+        self.indexes[model].remove(id)
+
+    def adjust(self, model, id, delta):
+        self.indexes[model].adjust(id, delta)
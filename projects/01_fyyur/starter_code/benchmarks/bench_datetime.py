@@ -0,0 +1,50 @@
+# Compares the template datetime filter before and after filters.py.
+#
+#   python benchmarks/bench_datetime.py [count]
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import babel.dates
+import dateutil.parser
+from filters import format_datetime, format_datetimes
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was in app.py, fed with str(datetime) as /shows did
+    if isinstance(value, str):
+        date = dateutil.parser.parse(value)
+    else:
+        date = value
+    if format == 'full':
+        format="EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format="EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:8.3f}s {:10.2f} us/value'.format(label, elapsed, elapsed / count * 1e6))
+    return result
+
+
+def main(count):
+    base = datetime(2021, 4, 11, 15, 40)
+    values = [base + timedelta(minutes=17 * i) for i in range(count)]
+
+    legacy = timed('legacy (str + parse)', lambda: [legacy_format_datetime(str(v), 'full') for v in values], count)
+    single = timed('format_datetime', lambda: [format_datetime(v, 'full') for v in values], count)
+    batch = timed('format_datetimes (batch)', lambda: format_datetimes(values, 'full'), count)
+
+    assert legacy == single == batch
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,89 @@
+# Cold start of a worker: imports `app` and calls create_app() in a fresh
+# interpreter a few times, and fails when the median exceeds the budget or
+# when a module meant to be imported on first use (see the top of app.py) is
+# imported at startup:
+#
+#   python benchmarks/bench_import.py
+#   python benchmarks/bench_import.py --runs 10 --budget-ms 300 --top 30
+#
+# One more run under `python -X importtime` lists the slowest imports by
+# cumulative time, so a regression can be traced to the module that brought
+# it in; it is not timed, the flag slows the imports down.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+STARTER_CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# imported by the commands, routes and filters that need them
+DEFERRED = ('flask_migrate', 'alembic', 'flask_moment', 'forms')
+
+# on a development laptop; pass --budget-ms for slower machines
+BUDGET_MS = 600
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': [name for name in {deferred!r} if name in sys.modules]}}))
+'''
+
+
+def parse_importtime(stderr):
+    # {module: (self us, cumulative us)} from the -X importtime lines
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(importtime=False):
+    flags = ['-X', 'importtime'] if importtime else []
+    result = subprocess.run(
+        [sys.executable] + flags + ['-c', CHILD.format(deferred=DEFERRED)],
+        cwd=STARTER_CODE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the Fyyur cold start.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help='highest median import + create_app() time accepted')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    args = parser.parse_args()
+
+    timings = [run_once()[0]['ms'] for _ in range(args.runs)]
+    median = statistics.median(timings)
+    child, modules = run_once(importtime=True)
+
+    print('{:<40} {:>10} {:>10}'.format('module', 'self ms', 'cumul. ms'))
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print('{:<40} {:>10.1f} {:>10.1f}'.format(name, self_us / 1000, cumulative_us / 1000))
+    print('\nimport + create_app(): median {:.1f} ms, min {:.1f} ms, max {:.1f} ms over {} runs (budget {:.0f} ms)'.format(
+        median, min(timings), max(timings), args.runs, args.budget_ms))
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append('median {:.1f} ms is over the {:.0f} ms budget'.format(median, args.budget_ms))
+    if child['loaded']:
+        failures.append('imported at startup: {}'.format(', '.join(child['loaded'])))
+    for failure in failures:
+        print('FAIL: ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Per-request cost of logging on the request thread, before and after
+# logs.py: a synchronous FileHandler (as app.py used to attach) against the
+# QueueHandler pipeline, on a fast disk and on one that stalls 0.5ms per
+# write, and a Flask request with and without the access log.
+#
+# On a single core the listener thread still competes for the CPU, so the
+# request numbers there are an upper bound; what moves off the request thread
+# is the disk latency, which the stalled-disk rows show.
+#
+#   python benchmarks/bench_logging.py [count]
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+
+from flask import Flask
+from logs import init_logging, RecordQueueHandler
+
+
+class StalledFileHandler(logging.FileHandler):
+    # a disk that takes half a millisecond per write
+    def emit(self, record):
+        time.sleep(0.0005)
+        super().emit(record)
+
+
+def per_call(label, logger, count):
+    start = time.perf_counter()
+    for i in range(count):
+        logger.info('{"route": "/venues", "status": 200, "latency_ms": 1.0, "db_queries": 1}')
+    elapsed = time.perf_counter() - start
+    print('{:<36} {:8.2f} us/call'.format(label, elapsed / count * 1e6))
+
+
+def per_request(label, app, count):
+    client = app.test_client()
+    client.get('/')
+    start = time.perf_counter()
+    for i in range(count):
+        client.get('/')
+    elapsed = time.perf_counter() - start
+    print('{:<36} {:8.2f} us/request'.format(label, elapsed / count * 1e6))
+    return elapsed / count
+
+
+def make_app(directory, log_requests):
+    app = Flask(__name__)
+    app.config.update(
+        LOG_FILE=os.path.join(directory, 'error.log'),
+        ACCESS_LOG_FILE=os.path.join(directory, 'access.log'),
+        LOG_MAX_BYTES=10 * 1024 * 1024,
+        LOG_BACKUP_COUNT=1,
+        LOG_REQUESTS=log_requests
+    )
+    app.add_url_rule('/', 'index', lambda: 'ok')
+    return app, init_logging(app)
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as directory:
+        sync_logger = logging.getLogger('bench.sync')
+        sync_logger.propagate = False
+        sync_logger.setLevel(logging.INFO)
+        sync_logger.addHandler(logging.FileHandler(os.path.join(directory, 'sync.log')))
+        per_call('sync FileHandler', sync_logger, count)
+
+        app, listener = make_app(directory, log_requests=True)
+        # the handler of the app's loggers, without flask's default stderr one
+        access_logger = logging.Logger('bench.access', logging.INFO)
+        access_logger.handlers = [handler for handler in app.logger.handlers
+                                 if isinstance(handler, RecordQueueHandler)]
+        per_call('QueueHandler (logs.py)', access_logger, count)
+        listener.stop()
+
+        stalled_logger = logging.getLogger('bench.stalled')
+        stalled_logger.propagate = False
+        stalled_logger.setLevel(logging.INFO)
+        stalled_handler = StalledFileHandler(os.path.join(directory, 'stalled.log'))
+        stalled_logger.addHandler(stalled_handler)
+        per_call('sync FileHandler, stalled disk', stalled_logger, count // 10)
+
+        queued_logger = logging.getLogger('bench.queued')
+        queued_logger.propagate = False
+        queued_logger.setLevel(logging.INFO)
+        queue = SimpleQueue()
+        queued_logger.addHandler(RecordQueueHandler(queue))
+        listener = QueueListener(queue, StalledFileHandler(os.path.join(directory, 'queued.log')))
+        listener.start()
+        per_call('QueueHandler, stalled disk', queued_logger, count // 10)
+        listener.stop()
+
+        bare, listener = make_app(directory, log_requests=False)
+        without = per_request('request, no access log', bare, count)
+        listener.stop()
+
+        logged, listener = make_app(directory, log_requests=True)
+        with_log = per_request('request, queued access log', logged, count)
+        listener.stop()
+
+        print('{:<36} {:8.2f} us/request'.format('access log overhead', (with_log - without) * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,260 @@
+# Latency and query count of every route, through the Flask test client,
+# against whatever database config.py points at (seed it first with
+# `flask seed`). Each route is requested --requests times with ids drawn at
+# random from the database; the p50/p95/p99 latencies and query counts are
+# printed and saved as JSON, named after the current commit, so runs can be
+# compared across commits:
+#
+#   python benchmarks/bench_routes.py --requests 200
+#   python benchmarks/bench_routes.py --compare benchmarks/results/<old>.json
+#
+# The write routes run last and change the data: they edit existing rows and
+# create (then delete) rows of their own.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, Venue, Artist, Show
+
+app = create_app()
+page_cache = app.extensions['page_cache']
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(values, fraction):
+    # nearest rank on sorted values
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summary(values):
+    values = sorted(values)
+    return {
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1]
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def venue_form(name, rng):
+    return {
+        'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Congress Ave',
+        'phone': '512-555-{:04d}'.format(rng.randint(0, 9999)), 'genres': ['Jazz', 'Blues'],
+        'image_link': 'https://picsum.photos/400/300', 'facebook_link': 'https://www.facebook.com/bench',
+        'website_link': 'https://bench.example.com', 'seeking_description': 'Benchmark venue.'
+    }
+
+
+def artist_form(name, rng):
+    return {
+        'name': name, 'city': 'Austin', 'state': 'TX',
+        'phone': '512-555-{:04d}'.format(rng.randint(0, 9999)), 'genres': ['Rock_n_Roll'],
+        'image_link': 'https://picsum.photos/300/300', 'facebook_link': 'https://www.facebook.com/bench',
+        'website_link': 'https://bench.example.com', 'seeking_description': 'Benchmark artist.'
+    }
+
+
+def scenarios(rng, venue_ids, artist_ids, tag):
+    '''
+    scenarios(rng, venue_ids, artist_ids, tag)
+        (name, method, url, form data) factories, one per route; every call
+        returns the next request to send
+    '''
+    venue = lambda: rng.choice(venue_ids)
+    artist = lambda: rng.choice(artist_ids)
+    term = lambda: rng.choice(['a', 'venue', 'band', 'blue', 'golden owl', 'xyz'])
+    created = []
+    counter = iter(range(10 ** 9))
+
+    def created_venue():
+        name = 'Bench Venue {} {}'.format(tag, next(counter))
+        created.append(name)
+        return venue_form(name, rng)
+
+    def created_artist():
+        name = 'Bench Band {} {}'.format(tag, next(counter))
+        created.append(name)
+        return artist_form(name, rng)
+
+    def deleted(model):
+        # the last row created by the write routes above
+        with app.app_context():
+            return db.session.query(model.id).filter_by(name=created.pop()).scalar()
+
+    week = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    future = (datetime.utcnow() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    return [
+        ('index', 'GET', lambda: ('/', None)),
+        ('venues', 'GET', lambda: ('/venues', None)),
+        ('venues?genre', 'GET', lambda: ('/venues?genre=Jazz', None)),
+        ('search_venues', 'POST', lambda: ('/venues/search', {'search_term': term()})),
+        ('show_venue', 'GET', lambda: ('/venues/{}'.format(venue()), None)),
+        ('create_venue_form', 'GET', lambda: ('/venues/create', None)),
+        ('artists', 'GET', lambda: ('/artists', None)),
+        ('artists?genre', 'GET', lambda: ('/artists?genre=Jazz', None)),
+        ('genres', 'GET', lambda: ('/genres', None)),
+        ('search_artists', 'POST', lambda: ('/artists/search', {'search_term': term()})),
+        ('show_artist', 'GET', lambda: ('/artists/{}'.format(artist()), None)),
+        ('edit_artist', 'GET', lambda: ('/artists/{}/edit'.format(artist()), None)),
+        ('edit_venue', 'GET', lambda: ('/venues/{}/edit'.format(venue()), None)),
+        ('create_artist_form', 'GET', lambda: ('/artists/create', None)),
+        ('shows', 'GET', lambda: ('/shows', None)),
+        ('create_shows', 'GET', lambda: ('/shows/create', None)),
+        ('cache_stats', 'GET', lambda: ('/cache/stats', None)),
+        ('db_stats', 'GET', lambda: ('/db/stats', None)),
+        ('autocomplete', 'GET', lambda: ('/autocomplete?type={}&q={}'.format(
+            rng.choice(['venues', 'artists']), term()[:rng.randint(1, 4)]), None)),
+        ('api.venues', 'GET', lambda: ('/api/venues', None)),
+        ('api.venue', 'GET', lambda: ('/api/venues/{}'.format(venue()), None)),
+        ('api.artists', 'GET', lambda: ('/api/artists', None)),
+        ('api.artist', 'GET', lambda: ('/api/artists/{}'.format(artist()), None)),
+        ('api.shows', 'GET', lambda: ('/api/shows', None)),
+        ('api.calendar', 'GET', lambda: ('/api/calendar?start={}&end={}'.format(
+            week.strftime('%Y-%m-%d'), (week + timedelta(days=7)).strftime('%Y-%m-%d')), None)),
+        ('api.search_names', 'GET', lambda: ('/api/search?type=artists&q={}'.format(term()), None)),
+        # writes
+        ('create_venue_submission', 'POST', lambda: ('/venues/create', created_venue())),
+        ('create_artist_submission', 'POST', lambda: ('/artists/create', created_artist())),
+        ('create_show_submission', 'POST', lambda: (
+            '/shows/create', {'venue_id': venue(), 'artist_id': artist(), 'start_time': future})),
+        ('edit_artist_submission', 'POST', lambda: (
+            '/artists/{}/edit'.format(artist()), artist_form('Bench Band {} {}'.format(tag, next(counter)), rng))),
+        ('edit_venue_submission', 'POST', lambda: (
+            '/venues/{}/edit'.format(venue()), venue_form('Bench Venue {} {}'.format(tag, next(counter)), rng))),
+        ('delete_artist', 'POST', lambda: ('/artists/{}/delete'.format(deleted(Artist)), None)),
+        ('delete_venue', 'POST', lambda: ('/venues/{}/delete'.format(deleted(Venue)), None))
+    ]
+
+
+def run(requests, seed):
+    rng = random.Random(seed)
+    # a failing route is reported as its 500s rather than ending the run
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = app.test_client()
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    with app.app_context():
+        engine = db.engine
+        venue_ids = [id for id, in db.session.query(Venue.id)]
+        artist_ids = [id for id, in db.session.query(Artist.id)]
+        counts = {
+            'venues': len(venue_ids),
+            'artists': len(artist_ids),
+            'shows': db.session.query(db.func.count(Show.id)).scalar()
+        }
+        db.session.remove()
+    if not venue_ids or not artist_ids:
+        sys.exit('The database is empty, seed it first with `flask seed`.')
+
+    event.listen(engine, 'before_cursor_execute', count)
+    results = {}
+    try:
+        for name, method, make in scenarios(rng, venue_ids, artist_ids, int(time.time())):
+            latencies = []
+            query_counts = []
+            statuses = {}
+            # the form pages render a CSRF token, the submissions are sent
+            # without one as in the tests
+            app.config['WTF_CSRF_ENABLED'] = method == 'GET'
+            for _ in range(requests):
+                url, data = make()
+                queries[0] = 0
+                start = time.perf_counter()
+                # streamed pages are only rendered as the body is read, and
+                # closing the response pops its request context
+                response = client.open(url, method=method, data=data)
+                response.get_data()
+                response.close()
+                latencies.append((time.perf_counter() - start) * 1000)
+                query_counts.append(queries[0])
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            results[name] = {
+                'method': method,
+                'latency_ms': summary(latencies),
+                'queries': summary(query_counts),
+                'statuses': {str(status): count for status, count in sorted(statuses.items())}
+            }
+            print_row(name, results[name])
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    return {
+        'commit': commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'database': engine.dialect.name,
+        'rows': counts,
+        'requests_per_route': requests,
+        'seed': seed,
+        'page_cache': page_cache.stats(),
+        'routes': results
+    }
+
+
+def print_row(name, result):
+    latency = result['latency_ms']
+    print('{:<26} {:>9.2f} {:>9.2f} {:>9.2f} ms {:>6} {:>6} queries  {}'.format(
+        name, latency['p50'], latency['p95'], latency['p99'],
+        result['queries']['p50'], result['queries']['max'],
+        ' '.join('{}x{}'.format(count, status) for status, count in result['statuses'].items())))
+
+
+def compare(current, previous):
+    print('\np95 against {} ({}):'.format(previous['commit'], previous['created_at']))
+    for name, result in current['routes'].items():
+        before = previous['routes'].get(name)
+        if before is None:
+            continue
+        old, new = before['latency_ms']['p95'], result['latency_ms']['p95']
+        print('{:<26} {:>9.2f} -> {:>9.2f} ms {:>+7.1f}%  queries {} -> {}'.format(
+            name, old, new, (new - old) / old * 100 if old else 0,
+            before['queries']['p50'], result['queries']['p50']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every Fyyur route.')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--seed', type=int, default=42, help='seed for the ids and terms requested')
+    parser.add_argument('--output', help='JSON file to write, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', help='an earlier JSON result to compare p95 latencies with')
+    args = parser.parse_args()
+
+    print('{:<26} {:>9} {:>9} {:>9}    {:>6} {:>6}'.format('route', 'p50', 'p95', 'p99', 'q p50', 'q max'))
+    result = run(args.requests, args.seed)
+
+    output = args.output or os.path.join(RESULTS, '{}.json'.format(result['commit']))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print('\nSaved {}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
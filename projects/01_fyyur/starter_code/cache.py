@@ -0,0 +1,134 @@
+#----------------------------------------------------------------------------#
+# Cache
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from werkzeug.utils import import_string
+
+MISSING = object()
+
+
+class LRUCache:
+    '''
+    LRUCache(max_size, ttl)
+        in-process, thread safe cache that evicts the least recently used
+        entry once max_size is reached and expires entries after ttl seconds,
+        or after the ttl given to set()
+
+    Any object with the same get/set/delete/clear methods can be plugged into
+    PageCache instead, e.g. a thin wrapper around a shared memcached client.
+    '''
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PageCache:
+    '''
+    PageCache(backend)
+        read-through cache of venue and artist page data keyed by entity id,
+        counting hits and misses so the size can be tuned
+    '''
+    # Each key has a version token next to it in the backend, replaced by
+    # invalidate(). A page loaded while a commit invalidates its key is not
+    # kept: the token read before the load no longer matches after it. The
+    # tokens share the backend, a cached page takes two of its entries.
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        backend = config.get('PAGE_CACHE_BACKEND')
+        if backend is None:
+            return cls(LRUCache(config.get('PAGE_CACHE_SIZE', 1024), config.get('PAGE_CACHE_TTL', 300)))
+        if isinstance(backend, str):
+            backend = import_string(backend)()
+        return cls(backend)
+
+    @staticmethod
+    def key(kind, id):
+        return '{}:{}'.format(kind, id)
+
+    def version(self, key):
+        token = self.backend.get('version:' + key)
+        if token is MISSING or token is None:
+            token = uuid.uuid4().hex
+            self.backend.set('version:' + key, token)
+        return token
+
+    def get_or_load(self, kind, id, loader):
+        key = self.key(kind, id)
+        value = self.backend.get(key)
+        if value is not MISSING and value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        version = self.version(key)
+        value = loader()
+        if self.backend.get('version:' + key) == version:
+            self.backend.set(key, value)
+            # an invalidation between the check and the set
+            if self.backend.get('version:' + key) != version:
+                self.backend.delete(key)
+        return value
+
+    def invalidate(self, kind, id):
+        key = self.key(kind, id)
+        self.backend.delete('version:' + key)
+        self.backend.delete(key)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        stats = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0
+        }
+        if isinstance(self.backend, LRUCache):
+            stats['size'] = len(self.backend)
+            stats['max_size'] = self.backend.max_size
+            stats['ttl'] = self.backend.ttl
+        return stats
@@ -0,0 +1,223 @@
+#----------------------------------------------------------------------------#
+# Upcoming show counters
+#----------------------------------------------------------------------------#
+
+# Venue.upcoming_shows_count and Artist.upcoming_shows_count hold the number of
+# shows starting after CounterState.swept_until, so the listings and searches
+# read a column instead of counting shows on every request.
+#
+# - Shows added, moved or deleted through the ORM adjust the counters in the
+#   same flush, so in the same transaction (see _after_flush). Bulk inserts
+#   call add_shows() themselves.
+# - The sweeper moves swept_until to now and decrements the counters for the
+#   shows that started in between; run it every minute or so:
+#
+#     flask counters sweep --every 60
+#
+# - `flask counters verify` recounts and reports drift, --repair fixes it.
+#
+# Counters are exact as of the last sweep: a show that started since then is
+# still counted as upcoming until the next one. The watermark row is read FOR
+# SHARE by writers and locked FOR UPDATE by the sweeper and the repair, so a
+# write never adjusts the counters against a watermark that is moving.
+
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+
+from models import db, Venue, Artist, Show, CounterState
+
+STATE_ID = 1
+
+
+def watermark(connection, lock=False):
+    '''
+    watermark(connection, lock)
+        returns swept_until, creating the state row on an empty database;
+        holds a share lock on it, or an exclusive one when lock is set
+    '''
+    table = CounterState.__table__
+    query = db.select([table.c.swept_until]).where(table.c.id == STATE_ID)
+    swept_until = connection.execute(query.with_for_update(read=not lock)).scalar()
+    if swept_until is None:
+        swept_until = datetime.utcnow()
+        connection.execute(table.insert().values(id=STATE_ID, swept_until=swept_until))
+    return swept_until
+
+
+def apply_deltas(connection, model, deltas):
+    # one executemany, in id order so concurrent writers lock rows in the
+    # same order
+    deltas = sorted((id, delta) for id, delta in deltas.items() if id is not None and delta)
+    if not deltas:
+        return
+    table = model.__table__
+    connection.execute(
+        table.update().where(table.c.id == db.bindparam('_id')).values(
+            upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('_delta')),
+        [{'_id': id, '_delta': delta} for id, delta in deltas]
+    )
+
+
+def adjust(connection, changes):
+    '''
+    adjust(connection, changes)
+        applies +1/-1 changes given as (sign, venue_id, artist_id, start_time)
+        to the counters, counting only shows after the watermark
+    '''
+    changes = list(changes)
+    if not changes:
+        return
+    swept_until = watermark(connection)
+    venues = Counter()
+    artists = Counter()
+    for sign, venue_id, artist_id, start_time in changes:
+        if start_time is not None and start_time > swept_until:
+            venues[venue_id] += sign
+            artists[artist_id] += sign
+    apply_deltas(connection, Venue, venues)
+    apply_deltas(connection, Artist, artists)
+
+
+def add_shows(rows):
+    '''
+    add_shows(rows)
+        counts shows inserted without the ORM, given as dicts with venue_id,
+        artist_id and start_time, in the current transaction
+    '''
+    adjust(db.session.connection(), (
+        (1, row['venue_id'], row['artist_id'], row['start_time']) for row in rows))
+
+
+COUNTED = ('venue_id', 'artist_id', 'start_time')
+
+
+def _load_old_value(show, value, oldvalue, initiator):
+    pass
+
+
+# with active_history the old value of an expired attribute is loaded before
+# it is replaced, so a show moved after a commit still decrements its old
+# venue, artist or time
+for name in COUNTED:
+    db.event.listen(getattr(Show, name), 'set', _load_old_value, active_history=True)
+
+
+def _values(show, current):
+    # the (venue_id, artist_id, start_time) of a show before or after the
+    # changes being flushed
+    state = inspect(show)
+    values = []
+    for name in COUNTED:
+        history = state.attrs[name].history
+        if not current and history.deleted:
+            values.append(history.deleted[0])
+        else:
+            values.append(getattr(show, name))
+    return tuple(values)
+
+
+def _after_flush(session, flush_context):
+    changes = []
+    for show in session.new:
+        if isinstance(show, Show):
+            changes.append((1,) + _values(show, current=True))
+    for show in session.deleted:
+        if isinstance(show, Show):
+            changes.append((-1,) + _values(show, current=False))
+    for show in session.dirty:
+        if isinstance(show, Show) and session.is_modified(show):
+            before, after = _values(show, current=False), _values(show, current=True)
+            if before != after:
+                changes.append((-1,) + before)
+                changes.append((1,) + after)
+    if changes:
+        adjust(session.connection(), changes)
+
+
+db.event.listen(db.session, 'after_flush', _after_flush)
+
+
+def sweep(now=None):
+    '''
+    sweep(now)
+        moves the watermark to now, decrementing the counters for the shows
+        that started since the last sweep; returns the number of such shows
+    '''
+    now = now or datetime.utcnow()
+    connection = db.session.connection()
+    swept_until = watermark(connection, lock=True)
+    if now <= swept_until:
+        db.session.commit()
+        return 0
+    started = db.and_(Show.start_time > swept_until, Show.start_time <= now)
+    swept = db.session.query(db.func.count(Show.id)).filter(started).scalar()
+    for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        counts = db.session.query(foreign_key, db.func.count(Show.id)).filter(started).group_by(foreign_key)
+        apply_deltas(connection, model, {id: -count for id, count in counts})
+    table = CounterState.__table__
+    connection.execute(table.update().where(table.c.id == STATE_ID).values(swept_until=now))
+    db.session.commit()
+    return swept
+
+
+def verify(repair=False):
+    '''
+    verify(repair)
+        recounts every counter against the shows table and returns the
+        drifted ones as (table, id, stored, actual); with repair set, fixes
+        them in the same transaction
+    '''
+    connection = db.session.connection()
+    swept_until = watermark(connection, lock=repair)
+    drift = []
+    for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        actual = db.select([db.func.count(Show.id)]).where(
+            db.and_(foreign_key == model.id, Show.start_time > swept_until)
+        ).scalar_subquery()
+        rows = db.session.query(model.id, model.upcoming_shows_count, actual).filter(
+            model.upcoming_shows_count != actual).order_by(model.id)
+        drift.extend((model.__tablename__, id, stored, count) for id, stored, count in rows)
+        if repair:
+            table = model.__table__
+            connection.execute(
+                table.update().where(table.c.upcoming_shows_count != actual).values(
+                    upcoming_shows_count=actual))
+    db.session.commit()
+    return drift
+
+
+counters_command = AppGroup('counters', help='Maintain the upcoming show counters.')
+
+
+@counters_command.command('sweep')
+@click.option('--every', type=float, default=None,
+              help='Keep sweeping every this many seconds instead of once.')
+def sweep_command(every):
+    """Move shows that have started out of the upcoming counters."""
+    while True:
+        swept = sweep()
+        click.echo('Swept {} shows'.format(swept))
+        if every is None:
+            return
+        db.session.remove()
+        time.sleep(every)
+
+
+@counters_command.command('verify')
+@click.option('--repair', is_flag=True, help='Rewrite the counters that drifted.')
+def verify_command(repair):
+    """Recount the upcoming show counters and report any drift."""
+    drift = verify(repair=repair)
+    for table, id, stored, actual in drift:
+        click.echo('{} {}: stored {}, actual {}'.format(table, id, stored, actual))
+    if not drift:
+        click.echo('Counters are consistent')
+    elif repair:
+        click.echo('Repaired {} counters'.format(len(drift)))
+    else:
+        raise click.ClickException('{} counters drifted, run with --repair'.format(len(drift)))
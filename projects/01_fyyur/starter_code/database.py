@@ -0,0 +1,209 @@
+#----------------------------------------------------------------------------#
+# Database
+#----------------------------------------------------------------------------#
+
+# Read replicas and connection pools.
+#
+# Every SQLALCHEMY_BINDS entry named replica* is a read replica of the
+# primary database. Handlers decorated with @read_only pick one per request
+# and run their plain SELECTs on it; flushes, bulk updates and deletes and
+# SELECT ... FOR UPDATE always go to the primary, and once a request has
+# written, the rest of it reads the primary too. A client that wrote is sent
+# to the primary for REPLICA_STICKY_SECONDS, through a cookie, so it reads
+# its own writes while the replicas catch up. Reads that fill a cache which a
+# write has just invalidated should stay on the primary (no @read_only, or
+# `with db.primary():`), or a lagging replica could put the old data back.
+#
+# Engines are created with SQLALCHEMY_ENGINE_OPTIONS (pool size, overflow,
+# timeout, recycle, pre-ping). Their pools time every checkout, including
+# the wait for a free connection, see pool_stats() and /db/stats. SQLite has
+# no connection to wait for and keeps its own pool without the queue options.
+
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import exc, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica'
+STICKY_COOKIE = 'primary_until'
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class PoolMetrics:
+    '''
+    PoolMetrics(size)
+        checkout count, timeouts and the durations of the last size
+        checkouts of one pool
+    '''
+    def __init__(self, size=1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self._waits = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self._waits.append(seconds * 1000)
+
+    def timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+        percentile = lambda fraction: round(waits[min(int(fraction * len(waits)), len(waits) - 1)], 3) if waits else 0
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'checkout_ms': {
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': round(waits[-1], 3) if waits else 0
+            }
+        }
+
+
+class TimedQueuePool(QueuePool):
+    # a QueuePool recording how long each checkout waited, connecting
+    # included, in self.metrics
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeout()
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+def _is_write(clause):
+    return isinstance(clause, UpdateBase) or (
+        isinstance(clause, Select) and clause._for_update_arg is not None)
+
+
+class RoutingSession(SignallingSession):
+    '''
+    RoutingSession
+        sends the plain SELECTs of a @read_only request to its replica
+        until the request writes
+    '''
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or _is_write(clause):
+            self.info['wrote'] = True
+            if has_request_context():
+                g.db_wrote = True
+        elif isinstance(clause, Select) and not self.info.get('wrote'):
+            replica = g.get('db_replica') if has_request_context() else None
+            if replica is not None:
+                return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''
+    RoutingSQLAlchemy()
+        SQLAlchemy with read replica routing and timed connection pools
+    '''
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+        app.after_request(self._stick_to_primary)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine_opts = dict(engine_opts)
+        if sa_url.get_backend_name() == 'sqlite':
+            for option in QUEUE_POOL_OPTIONS:
+                engine_opts.pop(option, None)
+        else:
+            engine_opts.setdefault('poolclass', TimedQueuePool)
+        return super().create_engine(sa_url, engine_opts)
+
+    def replica_binds(self, app=None):
+        binds = self.get_app(app).config.get('SQLALCHEMY_BINDS') or {}
+        return sorted(bind for bind in binds if bind.startswith(REPLICA_PREFIX))
+
+    def pick_replica(self):
+        # None sends the request to the primary: no replica, or a client
+        # that has just written
+        replicas = self.replica_binds()
+        sticky_until = request.cookies.get(STICKY_COOKIE, type=float)
+        if not replicas or (sticky_until is not None and sticky_until > time.time()):
+            return None
+        return random.choice(replicas)
+
+    @contextmanager
+    def primary(self):
+        '''
+        with db.primary():
+            reads the primary inside a @read_only request
+        '''
+        replica = g.pop('db_replica', None)
+        try:
+            yield
+        finally:
+            if replica is not None:
+                g.db_replica = replica
+
+    def _stick_to_primary(self, response):
+        if g.get('db_wrote'):
+            seconds = self.get_app().config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+        return response
+
+    def pool_stats(self, app=None):
+        '''
+        pool_stats(app)
+            size, usage and checkout times of the pool of every engine
+            created so far, by bind name ('primary' for the default one)
+        '''
+        app = self.get_app(app)
+        stats = {}
+        for bind, connector in get_state(app).connectors.items():
+            pool = connector.get_engine().pool
+            if isinstance(pool, TimedQueuePool):
+                stats[bind or 'primary'] = dict(
+                    pool.metrics.stats(),
+                    size=pool.size(),
+                    checked_out=pool.checkedout(),
+                    overflow=pool.overflow()
+                )
+            else:
+                stats[bind or 'primary'] = {'status': pool.status()}
+        return stats
+
+
+def read_only(view):
+    '''
+    @read_only
+        lets the view read from a replica, see RoutingSession
+    '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = get_state(current_app).db.pick_replica()
+        return view(*args, **kwargs)
+    return wrapper
@@ -27,6 +27,16 @@ class Genre(enum.Enum):
         """ Methods decorated with @classmethod can be called statically without having an instance of the class."""
         return [(choice.name, choice.value) for choice in cls]
 
+    @classmethod
+    def coerce(cls, value):
+        """ Returns the stored name of a genre given its name or its label, None if there is no such genre."""
+        if value in cls.__members__:
+            return value
+        try:
+            return cls(value).name
+        except ValueError:
+            return None
+
 
 class State(enum.Enum):
     AL = 'AL'
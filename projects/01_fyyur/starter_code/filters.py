@@ -0,0 +1,44 @@
+#----------------------------------------------------------------------------#
+# Filters
+#----------------------------------------------------------------------------#
+
+from functools import lru_cache
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=None)
+def compile_format(format='medium', locale='en'):
+    '''
+    compile_format(format, locale)
+        parses the babel pattern of a named (or custom) format and the
+        locale once; the result is reused for every later call
+    '''
+    # babel is only needed once a date is formatted; flask_wtf has usually
+    # loaded it already, see the imports of app.py
+    from babel.core import Locale
+    from babel.dates import parse_pattern
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    if isinstance(value, str):
+        # only legacy callers still hand over strings
+        import dateutil.parser
+        value = dateutil.parser.parse(value)
+    pattern, locale = compile_format(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    '''
+    format_datetimes(values, format, locale)
+        formats a whole list of datetimes, e.g. the start times of a page
+        of shows, resolving the pattern only once
+    '''
+    pattern, locale = compile_format(format, locale)
+    apply = pattern.apply
+    return [apply(value, locale) for value in values]
@@ -1,37 +1,47 @@
 import re
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, InputRequired, AnyOf, URL, Optional, NumberRange, Length
 from enums import Genre, State
+from models import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES
 
 # Definition of validation functions
 
+PHONE_REGEX = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
+GENRE_NAMES = frozenset(name for name, _ in Genre.choices())
+STATE_NAMES = frozenset(name for name, _ in State.choices())
+
 def is_valid_phone(number):
-    regex = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
-    return regex.match(number)
+    return PHONE_REGEX.match(number)
 
 # Definition of main form Classes
 
 class ShowForm(FlaskForm):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # in minutes, used to detect double bookings
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=MAX_SHOW_MINUTES)],
+        default=DEFAULT_SHOW_MINUTES
+    )
 
 class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
     city = StringField(
-        'city', validators=[DataRequired()]
+        'city', validators=[DataRequired(), Length(max=120)]
     )
     state = SelectField(
         'state',
@@ -39,13 +49,13 @@ class VenueForm(FlaskForm):
         choices=State.choices()
     )
     address = StringField(
-        'address', validators=[DataRequired()]
+        'address', validators=[DataRequired(), Length(max=120)]
     )
     phone = StringField(
-        'phone'
+        'phone', validators=[Length(max=120)]
     )
     image_link = StringField(
-        'image_link'
+        'image_link', validators=[Length(max=500)]
     )
     genres = SelectMultipleField(
         'genres',
@@ -53,16 +63,16 @@ class VenueForm(FlaskForm):
         choices=Genre.choices()
     )
     facebook_link = StringField(
-        'facebook_link', validators=[URL()]
+        'facebook_link', validators=[URL(), Length(max=120)]
     )
     website_link = StringField(
-        'website_link'
+        'website_link', validators=[Length(max=120)]
     )
     looking_for_talent = BooleanField(
         'looking_for_talent'
     )
     seeking_description = StringField(
-        'seeking_description'
+        'seeking_description', validators=[Length(max=500)]
     )
     def validate(self):
         # Define a custom validate method in your Form:
@@ -72,10 +82,10 @@ class VenueForm(FlaskForm):
         if not is_valid_phone(self.phone.data):
             self.phone.errors.append('Invalid phone.')
             return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
+        if not GENRE_NAMES.issuperset(self.genres.data):
             self.genres.errors.append('Invalid genres.')
             return False
-        if self.state.data not in dict(State.choices()).keys():
+        if self.state.data not in STATE_NAMES:
             self.state.errors.append('Invalid state.')
             return False
         # if pass validation
@@ -88,7 +98,7 @@ class ArtistForm(FlaskForm):
         'name', validators=[DataRequired()]
     )
     city = StringField(
-        'city', validators=[DataRequired()]
+        'city', validators=[DataRequired(), Length(max=120)]
     )
     state = SelectField(
         'state', validators=[DataRequired()],
@@ -96,10 +106,10 @@ class ArtistForm(FlaskForm):
     )
     phone = StringField(
         # TODO implement validation logic for state
-        'phone'
+        'phone', validators=[Length(max=120)]
     )
     image_link = StringField(
-        'image_link'
+        'image_link', validators=[Length(max=500)]
     )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
@@ -107,16 +117,16 @@ class ArtistForm(FlaskForm):
      )
     facebook_link = StringField(
         # TODO implement enum restriction
-        'facebook_link', validators=[URL()]
+        'facebook_link', validators=[URL(), Length(max=120)]
      )
     website_link = StringField(
-        'website_link'
+        'website_link', validators=[Length(max=120)]
      )
     looking_for_venue = BooleanField(
         'looking_for_venue'
     )
     seeking_description = StringField(
-            'seeking_description'
+            'seeking_description', validators=[Length(max=500)]
      )
     def validate(self):
         #Define a custom validate method in your Form:
@@ -126,10 +136,10 @@ class ArtistForm(FlaskForm):
         if not is_valid_phone(self.phone.data):
             self.phone.errors.append('Invalid phone.')
             return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
+        if not GENRE_NAMES.issuperset(self.genres.data):
             self.genres.errors.append('Invalid genres.')
             return False
-        if self.state.data not in dict(State.choices()).keys():
+        if self.state.data not in STATE_NAMES:
             self.state.errors.append('Invalid state.')
             return False
         # if pass validation
@@ -0,0 +1,298 @@
+#----------------------------------------------------------------------------#
+# Bulk import
+#----------------------------------------------------------------------------#
+
+# Streams venues, artists or shows from a CSV or NDJSON file, validates every
+# row with the same form used by the create handlers and inserts the valid
+# rows in large batches: COPY on PostgreSQL, executemany everywhere else.
+# Rejected rows are written to a NDJSON report with their form errors. Shows
+# are also checked for unknown venues or artists and for double bookings, a
+# batch at a time (see Show.batch_booking_errors).
+#
+#   flask import-data venues venues.csv --report rejected.ndjson --workers 8
+#
+# Form validation costs far more than the inserts, so throughput scales with
+# --workers rather than with the batch size.
+#
+# In CSV files list fields such as genres are separated by ';'.
+#
+# A batch the database refuses (a name already taken, also within the batch)
+# is retried row by row, and the refused rows are reported like the invalid
+# ones.
+
+import csv
+import io
+import json
+import multiprocessing
+import time
+from itertools import islice
+
+import click
+from flask import Flask
+from flask.cli import with_appcontext
+from sqlalchemy import exc
+from werkzeug.datastructures import MultiDict
+
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_MINUTES
+import counters
+
+KINDS = {
+    'venues': ('VenueForm', Venue),
+    'artists': ('ArtistForm', Artist),
+    'shows': ('ShowForm', Show)
+}
+
+LIST_FIELDS = ('genres',)
+
+
+def read_rows(stream, format):
+    '''
+    read_rows(stream, format)
+        yields (line number, row dict) from a csv or ndjson text stream
+    '''
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            for field in LIST_FIELDS:
+                if row.get(field):
+                    row[field] = [value.strip() for value in row[field].split(';')]
+            yield row
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def to_formdata(row):
+    formdata = MultiDict()
+    for field, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(field, [str(item) for item in value])
+        elif isinstance(value, bool):
+            # a checkbox is only posted when it is checked
+            if value:
+                formdata[field] = 'y'
+        elif value is not None:
+            formdata[field] = str(value)
+    return formdata
+
+
+class Validator:
+    '''
+    Validator(form_class)
+        validates plain dicts against one reused form instance, which is much
+        cheaper than building a new form for every row
+    '''
+    def __init__(self, form_class):
+        self.form = form_class(formdata=None, meta={'csrf': False})
+        self.columns = [name for name in self.form.data if name != 'csrf_token']
+
+    def __call__(self, row):
+        form = self.form
+        form.process(to_formdata(row))
+        if not form.validate():
+            return None, {field: errors for field, errors in form.errors.items() if errors}
+        return {column: form[column].data for column in self.columns}, None
+
+
+def form_class(kind):
+    # wtforms is only imported once an import runs, not with the app
+    import forms
+    return getattr(forms, KINDS[kind][0])
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_worker_validate = None
+
+
+def _init_worker(kind):
+    # forms read their settings from the current app, a bare one will do
+    global _worker_validate
+    app = Flask(__name__)
+    app.config.from_object('config')
+    app.app_context().push()
+    _worker_validate = Validator(form_class(kind))
+
+
+def _validate_chunk(chunk):
+    return [(row, _worker_validate(row)) for row in chunk]
+
+
+def validate_rows(kind, rows, workers=1, chunk_size=1000):
+    '''
+    validate_rows(kind, rows, workers, chunk_size)
+        yields (row, (values, errors)) in input order; form validation is
+        the expensive part of an import, so it can be spread over processes
+    '''
+    if workers <= 1:
+        validate = Validator(form_class(kind))
+        for row in rows:
+            yield row, validate(row)
+        return
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(kind,)) as pool:
+        for results in pool.imap(_validate_chunk, chunked(rows, chunk_size)):
+            yield from results
+
+
+def validate_show(row, values):
+    # ShowForm falls back to today's date and to the default duration
+    if not row.get('start_time'):
+        return {'start_time': ['This field is required.']}
+    if values['duration'] is None:
+        values['duration'] = DEFAULT_SHOW_MINUTES
+    return None
+
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+def not_null_text(table, columns):
+    # the NOT NULL text columns: an empty form field is '' there, not NULL
+    return [column for column in columns
+            if not table.c[column].nullable and isinstance(table.c[column].type, db.String)]
+
+
+def copy_statement(table, columns):
+    # an unquoted empty CSV field is NULL to COPY, unless FORCE_NOT_NULL
+    options = 'FORMAT csv'
+    text_columns = not_null_text(table, columns)
+    if text_columns:
+        options += ', FORCE_NOT_NULL ({})'.format(', '.join('"{}"'.format(column) for column in text_columns))
+    return 'COPY "{}" ({}) FROM STDIN WITH ({})'.format(
+        table.name, ', '.join('"{}"'.format(column) for column in columns), options)
+
+
+def insert_batch(table, columns, batch):
+    '''
+    insert_batch(table, columns, batch)
+        inserts a list of row dicts in one round trip using COPY on
+        PostgreSQL and executemany otherwise; a row the database refuses
+        raises sqlalchemy.exc.IntegrityError or DataError either way
+    '''
+    for column in not_null_text(table, columns):
+        for values in batch:
+            if values[column] is None:
+                values[column] = ''
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for values in batch:
+            writer.writerow([_copy_value(values[column]) for column in columns])
+        buffer.seek(0)
+        statement = copy_statement(table, columns)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        except connection.dialect.dbapi.IntegrityError as error:
+            # raw DBAPI errors are not wrapped by SQLAlchemy
+            raise exc.IntegrityError(statement, None, error)
+        except connection.dialect.dbapi.DataError as error:
+            raise exc.DataError(statement, None, error)
+    else:
+        connection.execute(table.insert(), batch)
+
+
+REFUSED = (exc.IntegrityError, exc.DataError)
+
+
+def import_rows(kind, rows, batch_size=5000, report=None, workers=1):
+    '''
+    import_rows(kind, rows, batch_size, report, workers)
+        validates and inserts rows, returns (imported, rejected)
+    '''
+    model = KINDS[kind][1]
+    table = model.__table__
+    columns = [column for column in Validator(form_class(kind)).columns if column in table.c]
+    imported = rejected = 0
+    batch = []
+    sources = []
+
+    def reject(line, row, errors):
+        nonlocal rejected
+        rejected += 1
+        if report is not None:
+            report.write(json.dumps({'line': line, 'row': row, 'errors': errors}, default=str) + '\n')
+
+    def write(rows, origins):
+        # inserts and commits rows, rejecting the shows that conflict
+        nonlocal imported
+        if kind == 'shows':
+            # unknown ids and double bookings, for the whole batch at once
+            conflicts = Show.batch_booking_errors(rows)
+            for index in sorted(conflicts):
+                reject(*origins[index], conflicts[index])
+            rows = [values for index, values in enumerate(rows) if index not in conflicts]
+        if rows:
+            insert_batch(table, columns, rows)
+            if kind == 'shows':
+                counters.add_shows(rows)
+        db.session.commit()
+        imported += len(rows)
+
+    def flush():
+        # a row the database refuses (a duplicate name, a value too long for
+        # its column) fails its batch, which is then written row by row
+        nonlocal batch
+        try:
+            write(batch, sources)
+        except REFUSED:
+            db.session.rollback()
+            for values, origin in zip(batch, sources):
+                try:
+                    write([values], [origin])
+                except REFUSED as error:
+                    db.session.rollback()
+                    reject(*origin, {'database': [str(error.orig).strip().splitlines()[0]]})
+        batch = []
+        sources.clear()
+
+    for line, (row, (values, errors)) in enumerate(validate_rows(kind, rows, workers), start=1):
+        if values is not None and kind == 'shows':
+            errors = validate_show(row, values)
+        if errors:
+            reject(line, row, errors)
+            continue
+        batch.append({column: values[column] for column in columns})
+        sources.append((line, row))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return imported, rejected
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per insert statement.')
+@click.option('--report', type=click.File('w', encoding='utf-8'), default=None,
+              help='Where to write rejected rows as NDJSON.')
+@click.option('--workers', default=1, show_default=True, help='Processes used to validate rows.')
+@with_appcontext
+def import_command(kind, source, format, batch_size, report, workers):
+    """Bulk import venues, artists or shows from CSV or NDJSON."""
+    if format is None:
+        format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+    start = time.perf_counter()
+    imported, rejected = import_rows(kind, read_rows(source, format), batch_size, report, workers)
+    elapsed = time.perf_counter() - start
+    click.echo('Imported {} {} ({} rejected) in {:.2f}s, {:.0f} rows/s'.format(
+        imported, kind, rejected, elapsed, (imported + rejected) / elapsed if elapsed else 0))
@@ -0,0 +1,112 @@
+#----------------------------------------------------------------------------#
+# Logging
+#----------------------------------------------------------------------------#
+
+# Request threads only put records on a queue; a background QueueListener
+# formats them and writes the rotated files. Every request adds one JSON line
+# to the access log with its route, status, latency and number of queries.
+#
+# Each app gets its own queue, listener and access logger. Flask names
+# app.logger after the app, so apps created later take over its queue
+# handler, and the listener of the one replaced is stopped.
+
+import atexit
+import json
+import logging
+import time
+from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ACCESS_LOGGER = 'fyyur.access'
+
+
+class RecordQueueHandler(QueueHandler):
+    # plain records, like the access lines, need neither formatting nor a
+    # defensive copy before they cross to the listener thread
+    def prepare(self, record):
+        if record.args or record.exc_info:
+            return super().prepare(record)
+        return record
+
+
+def _stop(listener):
+    if listener._thread is not None:
+        listener.stop()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+event.listen(Engine, 'before_cursor_execute', _count_query)
+
+
+def init_logging(app):
+    '''
+    init_logging(app)
+        installs the queue based error and access logs, returns the listener
+    so that it can be stopped (and the queue drained) explicitly
+    '''
+    queue = SimpleQueue()
+
+    error_handler = RotatingFileHandler(
+        app.config['LOG_FILE'],
+        maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT']
+    )
+    error_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    error_handler.setLevel(logging.INFO)
+    error_handler.addFilter(lambda record: record.name != ACCESS_LOGGER)
+
+    access_handler = RotatingFileHandler(
+        app.config['ACCESS_LOG_FILE'],
+        maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT']
+    )
+    access_handler.setFormatter(Formatter('%(message)s'))
+    access_handler.addFilter(lambda record: record.name == ACCESS_LOGGER)
+
+    listener = QueueListener(queue, error_handler, access_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop, listener)
+
+    queue_handler = RecordQueueHandler(queue)
+    queue_handler.listener = listener
+    for handler in list(app.logger.handlers):
+        if isinstance(handler, RecordQueueHandler):
+            app.logger.removeHandler(handler)
+            _stop(handler.listener)
+    app.logger.setLevel(logging.INFO)
+    app.logger.addHandler(queue_handler)
+
+    # outside of the logging.getLogger() registry, so not shared by the apps
+    access_logger = logging.Logger(ACCESS_LOGGER, logging.INFO)
+    access_logger.addHandler(queue_handler)
+
+    if app.config['LOG_REQUESTS']:
+        @app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def log_request(response):
+            started = g.get('request_started')
+            if started is not None:
+                access_logger.info(json.dumps({
+                    'method': request.method,
+                    'route': request.url_rule.rule if request.url_rule else request.path,
+                    'status': response.status_code,
+                    'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+                    'db_queries': g.get('query_count', 0)
+                }))
+            return response
+
+    return listener
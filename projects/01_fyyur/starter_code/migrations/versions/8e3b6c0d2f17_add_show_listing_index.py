@@ -0,0 +1,24 @@
+"""Add index for keyset pagination of shows
+
+Revision ID: 8e3b6c0d2f17
+Revises: 5c1f2d7a9e41
+Create Date: 2026-10-18 10:02:31.648210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3b6c0d2f17'
+down_revision = '5c1f2d7a9e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
@@ -0,0 +1,32 @@
+"""Only keep the names of rows not deleted unique
+
+Revision ID: 9d3f6a2c1e85
+Revises: e4b1d7c92a53
+Create Date: 2026-10-18 20:31:47.118062
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6a2c1e85'
+down_revision = 'e4b1d7c92a53'
+branch_labels = None
+depends_on = None
+
+
+# A soft deleted venue or artist keeps its row until `flask purge`; its name
+# can be reused meanwhile.
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_constraint('{}_name_key'.format(table), table, type_='unique')
+        op.create_index('ix_{}_name'.format(table), table, ['name'], unique=True,
+                        postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+# fails while a deleted row and a live one share a name, purge them first
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_name'.format(table), table_name=table)
+        op.create_unique_constraint('{}_name_key'.format(table), table, ['name'])
@@ -0,0 +1,26 @@
+"""Add GIN indexes on venue and artist genres
+
+Revision ID: b4d9a1e5c380
+Revises: 8e3b6c0d2f17
+Create Date: 2026-10-18 11:20:07.391524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d9a1e5c380'
+down_revision = '8e3b6c0d2f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
@@ -0,0 +1,26 @@
+"""Add venue location index for the calendar
+
+Revision ID: c81d5e3a7f20
+Revises: a7e2c4f91b06
+Create Date: 2026-10-18 18:40:09.551284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d5e3a7f20'
+down_revision = 'a7e2c4f91b06'
+branch_labels = None
+depends_on = None
+
+
+# The calendar also range scans ix_Show_start_time_id (8e3b6c0d2f17) and
+# ix_Show_venue_id_start_time / ix_Show_artist_id_start_time (a7e2c4f91b06).
+def upgrade():
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
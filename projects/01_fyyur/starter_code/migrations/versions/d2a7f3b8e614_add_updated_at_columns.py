@@ -0,0 +1,28 @@
+"""Add updated_at to venues, artists and shows
+
+Revision ID: d2a7f3b8e614
+Revises: b4d9a1e5c380
+Create Date: 2026-10-18 12:05:52.774310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7f3b8e614'
+down_revision = 'b4d9a1e5c380'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('Artist', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('Show', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade():
+    op.drop_column('Show', 'updated_at')
+    op.drop_column('Artist', 'updated_at')
+    op.drop_column('Venue', 'updated_at')
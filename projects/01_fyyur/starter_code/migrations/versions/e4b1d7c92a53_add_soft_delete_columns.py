@@ -0,0 +1,30 @@
+"""Add soft delete columns to venues and artists
+
+Revision ID: e4b1d7c92a53
+Revises: c81d5e3a7f20
+Create Date: 2026-10-18 19:52:31.204817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b1d7c92a53'
+down_revision = 'c81d5e3a7f20'
+branch_labels = None
+depends_on = None
+
+
+# The partial indexes only hold the rows waiting for `flask purge`.
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_deleted_at'.format(table), table, ['deleted_at'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_deleted_at'.format(table), table_name=table)
+        op.drop_column(table, 'deleted_at')
@@ -0,0 +1,48 @@
+"""Add upcoming show counters to venues and artists
+
+Revision ID: f3c9b2a84d57
+Revises: d2a7f3b8e614
+Create Date: 2026-10-18 17:20:14.903155
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9b2a84d57'
+down_revision = 'd2a7f3b8e614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('CounterState',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('swept_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # start the counters at the current time, in UTC like the app
+    op.execute("""INSERT INTO "CounterState" (id, swept_until) VALUES (1, timezone('utc', now()))""")
+    op.execute("""
+        UPDATE "Venue" SET upcoming_shows_count = (
+            SELECT count(*) FROM "Show"
+            WHERE "Show".venue_id = "Venue".id
+            AND "Show".start_time > (SELECT swept_until FROM "CounterState" WHERE id = 1)
+        )
+    """)
+    op.execute("""
+        UPDATE "Artist" SET upcoming_shows_count = (
+            SELECT count(*) FROM "Show"
+            WHERE "Show".artist_id = "Artist".id
+            AND "Show".start_time > (SELECT swept_until FROM "CounterState" WHERE id = 1)
+        )
+    """)
+
+
+def downgrade():
+    op.drop_table('CounterState')
+    op.drop_column('Artist', 'upcoming_shows_count')
+    op.drop_column('Venue', 'upcoming_shows_count')
@@ -2,15 +2,126 @@
 # Models
 #----------------------------------------------------------------------------#
 
-from flask_sqlalchemy import SQLAlchemy
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import with_loader_criteria
+from database import RoutingSQLAlchemy
+from enums import Genre
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
-class Venue(db.Model):
+# shows last DEFAULT_SHOW_MINUTES unless given a duration, and never more
+# than MAX_SHOW_MINUTES, which bounds how long before a new show a
+# conflicting one can start
+DEFAULT_SHOW_MINUTES = 120
+MAX_SHOW_MINUTES = 24 * 60
+
+
+def split_shows(shows, current_time):
+    # partitions already loaded shows into (past, upcoming), oldest first
+    past_shows = []
+    upcoming_shows = []
+    for show in sorted(shows, key=lambda show: show.start_time):
+        if show.start_time > current_time:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+def has_genre(column, genre):
+    # `genres @> ARRAY[genre]` is the form the GIN index on genres can serve
+    return column.op('@>')(db.cast(postgresql.array([genre]), column.type))
+
+
+def genre_facets():
+    '''
+    genre_facets()
+        counts venues and artists per genre in a single aggregate query,
+        returning {'venues': {label: count}, 'artists': {label: count}}
+    '''
+    venue_genres = db.session.query(
+        db.literal('venues').label('kind'),
+        db.func.unnest(Venue.genres).label('genre')
+    )
+    artist_genres = db.session.query(
+        db.literal('artists').label('kind'),
+        db.func.unnest(Artist.genres).label('genre')
+    )
+    genres = venue_genres.union_all(artist_genres).subquery()
+    rows = db.session.query(
+        genres.c.kind,
+        genres.c.genre,
+        db.func.count()
+    ).group_by(genres.c.kind, genres.c.genre)
+
+    facets = {
+        'venues': {genre.value: 0 for genre in Genre},
+        'artists': {genre.value: 0 for genre in Genre}
+    }
+    for kind, genre, count in rows:
+        name = Genre.coerce(genre)
+        if name is not None:
+            facets[kind][Genre[name].value] += count
+    return facets
+
+# the name search indexes need pg_trgm, see search.py
+db.event.listen(
+    db.metadata,
+    'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+class SoftDeleted:
+    # a deleted venue or artist is only marked, and hidden from every ORM
+    # query (see _hide_deleted) until `flask purge` has removed its shows and
+    # then the row, see purge.py
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def soft_delete(cls, id):
+        # returns whether there was such a row to delete
+        return db.session.query(cls).filter(cls.id == id, cls.deleted_at.is_(None)).update(
+            {cls.deleted_at: datetime.utcnow()}, synchronize_session=False) > 0
+
+
+def _hide_deleted(execute_state):
+    # adds `deleted_at IS NULL` for every SoftDeleted entity of an ORM SELECT,
+    # including the relationship loads it triggers; queries with
+    # .execution_options(include_deleted=True) see the deleted rows.
+    # SQLAlchemy 1.4.2 leaves out joins with an explicit ON clause, which
+    # filter on deleted_at themselves (see Show.listing).
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get('include_deleted', False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(SoftDeleted, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
+
+
+db.event.listen(db.session, 'do_orm_execute', _hide_deleted)
+
+
+class Venue(SoftDeleted, db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        # the purge queue
+        db.Index('ix_Venue_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+        # a deleted name can be taken again before the purge removes the row
+        db.Index('ix_Venue_name', 'name', unique=True, postgresql_where=db.text('deleted_at IS NULL'),
+                 sqlite_where=db.text('deleted_at IS NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False, unique=True)
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
@@ -25,6 +136,9 @@ class Venue(db.Model):
     website_link = db.Column(db.String(120), nullable=True)
     looking_for_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500), nullable=False, default='Please update your talent seeking description here.')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+    # shows after CounterState.swept_until, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='venue', lazy=True)
 
     def details(self):
@@ -43,14 +157,64 @@ class Venue(db.Model):
             'image_link': self.image_link
         }
 
+    @classmethod
+    def with_shows(cls):
+        # a single query for the venue, its shows and their artists
+        return cls.query.options(db.joinedload(cls.shows).joinedload(Show.artist))
+
+    def page(self, current_time):
+        data = self.details()
+        # shows of a deleted artist, still waiting for the purge, load no artist
+        shows = [show for show in self.shows if show.artist is not None]
+        past_shows, upcoming_shows = split_shows(shows, current_time)
+        data['past_shows'] = list(map(Show.artist_show, past_shows))
+        data['upcoming_shows'] = list(map(Show.artist_show, upcoming_shows))
+        data['past_shows_count'] = len(past_shows)
+        data['upcoming_shows_count'] = len(upcoming_shows)
+        return data
+
+    @classmethod
+    def areas(cls, genre=None):
+        # one query: every venue with its upcoming show counter, sorted so
+        # that venues of the same city/state come out next to each other
+        query = db.session.query(
+            cls.city,
+            cls.state,
+            cls.id,
+            cls.name,
+            cls.upcoming_shows_count
+        )
+        if genre is not None:
+            query = query.filter(has_genre(cls.genres, genre))
+        rows = query.order_by(cls.city, cls.state, cls.name)
+
+        for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+            yield {
+                'city': city,
+                'state': state,
+                'venues': [{
+                    'id': venue_id,
+                    'name': name,
+                    'num_upcoming_shows': num_upcoming_shows
+                } for _, _, venue_id, name, num_upcoming_shows in venues]
+            }
+
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     # DONE
 
-class Artist(db.Model):
+class Artist(SoftDeleted, db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Artist_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+        # a deleted name can be taken again before the purge removes the row
+        db.Index('ix_Artist_name', 'name', unique=True, postgresql_where=db.text('deleted_at IS NULL'),
+                 sqlite_where=db.text('deleted_at IS NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False, unique=True)
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
@@ -64,6 +228,9 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120), nullable=True)
     looking_for_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500), nullable=False, default='Please update your venue seeking description here.')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+    # shows after CounterState.swept_until, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     shows = db.relationship('Show', backref='artist', lazy=True)
 
@@ -82,17 +249,201 @@ class Artist(db.Model):
             'image_link': self.image_link
         }
 
+    @classmethod
+    def with_shows(cls):
+        # a single query for the artist, its shows and their venues
+        return cls.query.options(db.joinedload(cls.shows).joinedload(Show.venue))
+
+    def page(self, current_time):
+        data = self.details()
+        shows = [show for show in self.shows if show.venue is not None]
+        past_shows, upcoming_shows = split_shows(shows, current_time)
+        data['past_shows'] = list(map(Show.venue_show, past_shows))
+        data['upcoming_shows'] = list(map(Show.venue_show, upcoming_shows))
+        data['past_shows_count'] = len(past_shows)
+        data['upcoming_shows_count'] = len(upcoming_shows)
+        return data
+
 # TODO: implement any missing fields, as a database migration using Flask-Migrate
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 # DONE
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # booking checks probe a time range of one venue or artist
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime())
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
+    # in minutes
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_MINUTES, server_default=str(DEFAULT_SHOW_MINUTES))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+
+    @classmethod
+    def listing(cls, limit, before=None):
+        # newest shows first, one page at a time; `before` is the
+        # (start_time, id) of the last show of the previous page
+        query = db.session.query(
+            cls.id,
+            cls.start_time,
+            cls.venue_id,
+            Venue.name.label('venue_name'),
+            cls.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        ).join(Venue, Venue.id == cls.venue_id).join(Artist, Artist.id == cls.artist_id).filter(
+            Venue.deleted_at.is_(None),
+            Artist.deleted_at.is_(None)
+        )
+        if before is not None:
+            query = query.filter(db.tuple_(cls.start_time, cls.id) < before)
+        return query.order_by(cls.start_time.desc(), cls.id.desc()).limit(limit).all()
+
+    @classmethod
+    def calendar(cls, start, end, limit, venue_id=None, artist_id=None, city=None, state=None, genre=None, after=None):
+        # shows starting in [start, end), in time order, one page at a time;
+        # `after` is the (start_time, id) of the last show of the previous
+        # page. Every filter narrows an index range: (venue_id, start_time),
+        # (artist_id, start_time), Venue (state, city) or the genres index,
+        # otherwise (start_time, id) itself.
+        query = db.session.query(
+            cls.id,
+            cls.start_time,
+            cls.duration,
+            cls.venue_id,
+            Venue.name.label('venue_name'),
+            Venue.city,
+            Venue.state,
+            cls.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        ).join(Venue, Venue.id == cls.venue_id).join(Artist, Artist.id == cls.artist_id).filter(
+            cls.start_time >= start,
+            cls.start_time < end,
+            Venue.deleted_at.is_(None),
+            Artist.deleted_at.is_(None)
+        )
+        if venue_id is not None:
+            query = query.filter(cls.venue_id == venue_id)
+        if artist_id is not None:
+            query = query.filter(cls.artist_id == artist_id)
+        if state is not None:
+            query = query.filter(Venue.state == state)
+        if city is not None:
+            query = query.filter(Venue.city == city)
+        if genre is not None:
+            query = query.filter(has_genre(Artist.genres, genre))
+        if after is not None:
+            query = query.filter(db.tuple_(cls.start_time, cls.id) > after)
+        return query.order_by(cls.start_time, cls.id).limit(limit).all()
+
+    @classmethod
+    def overlapping(cls, column, owner_id, start_time, duration):
+        # one range probe on (venue_id or artist_id, start_time): only shows
+        # starting less than MAX_SHOW_MINUTES before this one can overlap it
+        end_time = start_time + timedelta(minutes=duration)
+        rows = db.session.query(cls.id, cls.start_time, cls.duration).filter(
+            column == owner_id,
+            cls.start_time > start_time - timedelta(minutes=MAX_SHOW_MINUTES),
+            cls.start_time < end_time
+        )
+        return [id for id, start, minutes in rows if start + timedelta(minutes=minutes) > start_time]
+
+    @classmethod
+    def booking_errors(cls, venue_id, artist_id, start_time, duration=DEFAULT_SHOW_MINUTES):
+        '''
+        booking_errors(venue_id, artist_id, start_time, duration)
+            returns form style errors if the venue or the artist does not
+            exist, is deleted or is already booked during the show, {}
+            otherwise
+
+        The venue and artist rows are locked until the end of the
+        transaction, so two bookings of the same venue or artist are
+        checked one after the other. Venues are always locked before
+        artists.
+        '''
+        errors = {}
+        for column, model, label, owner_id in (
+            (cls.venue_id, Venue, 'venue', venue_id),
+            (cls.artist_id, Artist, 'artist', artist_id)
+        ):
+            key = column.key
+            if db.session.query(model.id).filter(model.id == owner_id).with_for_update().scalar() is None:
+                errors[key] = ['There is no {} with id {}.'.format(label, owner_id)]
+            elif cls.overlapping(column, owner_id, start_time, duration):
+                errors[key] = ['The {} is already booked at that time.'.format(label)]
+        return errors
+
+    @classmethod
+    def batch_booking_errors(cls, rows, chunk_size=500):
+        '''
+        batch_booking_errors(rows, chunk_size)
+            checks a batch of new shows, given as dicts with venue_id,
+            artist_id, start_time and duration, against the database and
+            against each other; returns {row index: errors}
+
+        Per venue (then artist) the rows are merged into time windows that
+        are looked up chunk_size at a time, so a batch costs a few indexed
+        range scans rather than one probe per row.
+        '''
+        errors = {}
+        limit = timedelta(minutes=MAX_SHOW_MINUTES)
+        for column, model, label in ((cls.venue_id, Venue, 'venue'), (cls.artist_id, Artist, 'artist')):
+            key = column.key
+            ids = sorted({row[key] for row in rows})
+            existing = {id for id, in db.session.query(model.id).filter(model.id.in_(ids)).order_by(model.id).with_for_update()}
+
+            # new shows of every owner, by start time
+            intervals = defaultdict(list)
+            for index, row in enumerate(rows):
+                if row[key] not in existing:
+                    errors.setdefault(index, {})[key] = ['There is no {} with id {}.'.format(label, row[key])]
+                    continue
+                start = row['start_time']
+                intervals[row[key]].append((start, start + timedelta(minutes=row['duration']), index))
+
+            # merged windows in which a booked show would overlap one of them
+            windows = []
+            for owner_id, owned in intervals.items():
+                owned.sort()
+                low, high = owned[0][0] - limit, owned[0][1]
+                for start, end, _ in owned[1:]:
+                    if start - limit > high:
+                        windows.append((owner_id, low, high))
+                        low = start - limit
+                    high = max(high, end)
+                windows.append((owner_id, low, high))
+
+            booked = defaultdict(list)
+            for chunk in range(0, len(windows), chunk_size):
+                probes = [
+                    db.and_(column == owner_id, cls.start_time > low, cls.start_time < high)
+                    for owner_id, low, high in windows[chunk:chunk + chunk_size]
+                ]
+                for owner_id, start, minutes in db.session.query(column, cls.start_time, cls.duration).filter(db.or_(*probes)):
+                    booked[owner_id].append((start, start + timedelta(minutes=minutes)))
+
+            for owner_id, owned in intervals.items():
+                taken = sorted(booked[owner_id])
+                starts = [start for start, _ in taken]
+                accepted_end = None
+                for start, end, index in owned:
+                    # booked shows starting before this one ends, at most
+                    # MAX_SHOW_MINUTES earlier
+                    candidates = taken[bisect_left(starts, start - limit):bisect_left(starts, end)]
+                    if any(booked_end > start for _, booked_end in candidates):
+                        errors.setdefault(index, {})[key] = ['The {} is already booked at that time.'.format(label)]
+                    elif accepted_end is not None and start < accepted_end:
+                        errors.setdefault(index, {})[key] = ['The {} is booked twice at that time in this batch.'.format(label)]
+                    elif index not in errors:
+                        accepted_end = end if accepted_end is None else max(accepted_end, end)
+        return errors
 
     def details(self):
         return{
@@ -101,19 +452,28 @@ class Show(db.Model):
         'artist_id': self.artist_id,
         'artist_name': self.artist.name,
         'artist_image': self.artist.image_link,
-        'start_time': str(self.start_time)
+        'start_time': self.start_time
         }
     def artist_show(self):
         return {
         'artist_id': self.artist_id,
         'artist_name': self.artist.name,
         'artist_image_link': self.artist.image_link,
-        'start_time': str(self.start_time)
+        'start_time': self.start_time
         }
     def venue_show(self):
         return {
         'venue_id': self.venue_id,
         'venue_name': self.venue.name,
         'venue_image_link': self.venue.image_link,
-        'start_time': str(self.start_time)
+        'start_time': self.start_time
         }
+
+
+class CounterState(db.Model):
+    # a single row: the upcoming show counters count the shows starting
+    # after swept_until, which the sweeper moves forward (see counters.py)
+    __tablename__ = 'CounterState'
+
+    id = db.Column(db.Integer, primary_key=True)
+    swept_until = db.Column(db.DateTime, nullable=False)
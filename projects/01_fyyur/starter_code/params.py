@@ -0,0 +1,55 @@
+#----------------------------------------------------------------------------#
+# Request parameters
+#----------------------------------------------------------------------------#
+
+# Parsing shared by the HTML controllers in app.py and the JSON api in api.py.
+
+from datetime import datetime, timedelta
+from flask import request, abort
+from enums import Genre
+
+
+def encode_cursor(start_time, show_id):
+  return '{}_{}'.format(start_time.isoformat(), show_id)
+
+def decode_cursor(cursor):
+  try:
+    start_time, show_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+  except ValueError:
+    abort(400)
+
+def requested_genre():
+  # ?genre= accepts either the stored name (Hip_Hop) or the label (Hip-Hop)
+  genre = request.args.get('genre')
+  if genre is None:
+    return None
+  name = Genre.coerce(genre)
+  if name is None:
+    abort(400)
+  return name
+
+def requested_datetime(name):
+  # ISO date or date and time; a missing or malformed value is a 400
+  value = request.args.get(name)
+  if value is None:
+    abort(400)
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    abort(400)
+
+def requested_range(max_days):
+  # ?start=&end= as a half open range of at most max_days
+  start = requested_datetime('start')
+  end = requested_datetime('end')
+  if not start < end <= start + timedelta(days=max_days):
+    abort(400)
+  return start, end
+
+def requested_limit(default, maximum):
+  # ?limit= capped at maximum, a 400 below 1
+  limit = min(request.args.get('limit', default, type=int), maximum)
+  if limit < 1:
+    abort(400)
+  return limit
@@ -0,0 +1,90 @@
+#----------------------------------------------------------------------------#
+# Purge
+#----------------------------------------------------------------------------#
+
+# Deleting a venue or an artist only sets its deleted_at, which hides it and
+# its shows at once (see SoftDeleted in models.py) whatever the number of
+# shows. This worker then removes the shows of every deleted row in batches
+# of PURGE_BATCH_SIZE, one transaction each, pausing PURGE_PAUSE seconds
+# between them so the locks and the WAL of a large venue are spread out
+# instead of held by a single statement, and finally the row itself:
+#
+#   flask purge --every 60
+#   flask purge --batch-size 200 --pause 0.5
+#
+# Removed upcoming shows decrement the counters of the other side in the
+# same transaction. No show is booked on a deleted row meanwhile: the
+# booking checks lock the venue and the artist, and do not see deleted ones.
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, Venue, Artist, Show
+import counters
+
+OWNERS = ((Venue, Show.venue_id, 'venues'), (Artist, Show.artist_id, 'artists'))
+
+
+def purge_shows(foreign_key, owner_id, batch_size, pause=0):
+    '''
+    purge_shows(foreign_key, owner_id, batch_size, pause)
+        deletes the shows with foreign_key == owner_id, batch_size per
+        transaction with pause seconds in between; returns how many
+    '''
+    purged = 0
+    while True:
+        rows = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time).filter(
+            foreign_key == owner_id).order_by(Show.id).limit(batch_size).with_for_update().all()
+        if not rows:
+            return purged
+        db.session.query(Show).filter(Show.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        counters.adjust(db.session.connection(), (
+            (-1, venue_id, artist_id, start_time) for _, venue_id, artist_id, start_time in rows))
+        db.session.commit()
+        purged += len(rows)
+        if len(rows) < batch_size:
+            return purged
+        time.sleep(pause)
+
+
+def purge(batch_size=500, pause=0):
+    '''
+    purge(batch_size, pause)
+        removes every deleted venue and artist with their shows, oldest
+        deletion first; returns {'venues': n, 'artists': n, 'shows': n}
+    '''
+    purged = {'venues': 0, 'artists': 0, 'shows': 0}
+    for model, foreign_key, kind in OWNERS:
+        deleted = db.session.query(model.id).filter(model.deleted_at.isnot(None)).order_by(
+            model.deleted_at, model.id).execution_options(include_deleted=True).all()
+        for owner_id, in deleted:
+            purged['shows'] += purge_shows(foreign_key, owner_id, batch_size, pause)
+            db.session.query(model).filter(model.id == owner_id, model.deleted_at.isnot(None)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            purged[kind] += 1
+    return purged
+
+
+@click.command('purge')
+@click.option('--every', type=float, default=None,
+              help='Keep purging every this many seconds instead of once.')
+@click.option('--batch-size', type=int, default=None, help='Shows per transaction, PURGE_BATCH_SIZE by default.')
+@click.option('--pause', type=float, default=None,
+              help='Seconds between two batches, PURGE_PAUSE by default.')
+@with_appcontext
+def purge_command(every, batch_size, pause):
+    """Remove the deleted venues and artists with their shows."""
+    config = current_app.config
+    batch_size = batch_size or config['PURGE_BATCH_SIZE']
+    pause = config['PURGE_PAUSE'] if pause is None else pause
+    while True:
+        purged = purge(batch_size, pause)
+        click.echo('Purged {venues} venues, {artists} artists and {shows} shows'.format(**purged))
+        if every is None:
+            return
+        db.session.remove()
+        time.sleep(every)
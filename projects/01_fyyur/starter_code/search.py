@@ -0,0 +1,36 @@
+#----------------------------------------------------------------------------#
+# Search
+#----------------------------------------------------------------------------#
+
+# Name search for venues and artists.
+#
+# The `%term%` ilike is served by a pg_trgm GIN index (see the migration
+# adding `ix_Venue_name_trgm` / `ix_Artist_name_trgm`) and results are ranked
+# by trigram similarity. The upcoming show counts are the counters maintained
+# by counters.py.
+
+from models import db
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def find(model, term):
+    '''
+    find(model, term)
+        returns the id, name and number of upcoming shows of every Venue or
+        Artist whose name contains term, best matches first
+    '''
+    query = db.session.query(model.id, model.name, model.upcoming_shows_count).filter(
+        model.name.ilike('%' + _escape_like(term) + '%', escape='\\'))
+    if term:
+        query = query.order_by(db.func.similarity(model.name, term).desc(), model.name)
+    else:
+        query = query.order_by(model.name)
+
+    return [{
+        'id': id,
+        'name': name,
+        'num_upcoming_shows': num_upcoming_shows
+    } for id, name, num_upcoming_shows in query]
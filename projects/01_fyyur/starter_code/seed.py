@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------#
+# Synthetic data
+#----------------------------------------------------------------------------#
+
+# Fills the database with a reproducible synthetic data set for benchmarks:
+# the same --seed and --anchor always produce the same rows.
+#
+#   flask seed --venues 10000 --artists 100000 --shows 1000000 --seed 42
+#
+# Cities, genres and show bookings follow skewed distributions, so a few
+# venues and artists carry most of the shows as on a real site, and show
+# start times spread over two years around --anchor (today by default) so
+# both the past and the upcoming halves of the pages are populated. Rows are
+# written with importer.insert_batch (COPY on PostgreSQL) without form
+# validation; generated values are valid by construction, but bookings are
+# not checked for conflicts.
+
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import click
+from flask.cli import with_appcontext
+
+from enums import Genre
+from importer import chunked, insert_batch
+from models import db, Venue, Artist, Show
+import counters
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Francisco', 'CA'), ('Austin', 'TX'), ('Seattle', 'WA'),
+    ('Denver', 'CO'), ('Nashville', 'TN'), ('Portland', 'OR'), ('New Orleans', 'LA'),
+    ('Boston', 'MA'), ('Atlanta', 'GA'), ('Miami', 'FL'), ('Minneapolis', 'MN')
+]
+
+ADJECTIVES = [
+    'Blue', 'Golden', 'Velvet', 'Electric', 'Silent', 'Crimson', 'Wild', 'Lucky',
+    'Midnight', 'Rusty', 'Neon', 'Hollow', 'Broken', 'Little', 'Grand', 'Lost'
+]
+NOUNS = [
+    'Room', 'Owl', 'Garden', 'Hall', 'Tiger', 'Lantern', 'Harbor', 'Echo',
+    'Anchor', 'River', 'Crown', 'Fox', 'Palace', 'Parlor', 'Station', 'Engine'
+]
+
+GENRES = [genre.name for genre in Genre]
+
+# shows are booked over anchor - SPREAD .. anchor + SPREAD
+SPREAD = timedelta(days=365)
+
+
+def zipf_weights(count, exponent=0.8):
+    # cumulative weights giving rank r a share proportional to 1 / r**exponent
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def name(rng, kind, number):
+    # readable names, unique thanks to the number
+    return '{} {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), kind, number)
+
+
+def phone(rng):
+    return '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999))
+
+
+def venue_rows(rng, count, city_weights):
+    for number in range(1, count + 1):
+        city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+        yield {
+            'name': name(rng, 'Venue', number),
+            'city': city,
+            'state': state,
+            'address': '{} {} St'.format(rng.randint(1, 9999), rng.choice(NOUNS)),
+            'phone': phone(rng),
+            'image_link': 'https://picsum.photos/seed/venue{}/400/300'.format(number),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(number),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'website_link': 'https://venue{}.example.com'.format(number),
+            'looking_for_talent': rng.random() < 0.3,
+            'seeking_description': 'Looking for local acts.'
+        }
+
+
+def artist_rows(rng, count, city_weights):
+    for number in range(1, count + 1):
+        city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+        yield {
+            'name': name(rng, 'Band', number),
+            'city': city,
+            'state': state,
+            'phone': phone(rng),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'image_link': 'https://picsum.photos/seed/artist{}/300/300'.format(number),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(number),
+            'website_link': 'https://artist{}.example.com'.format(number),
+            'looking_for_venue': rng.random() < 0.3,
+            'seeking_description': 'Looking for a stage.'
+        }
+
+
+def show_rows(rng, count, venue_ids, artist_ids, anchor, batch_size):
+    # venues and artists are drawn with Zipf weights over a shuffled order,
+    # so popularity does not follow the ids
+    venue_ids = rng.sample(venue_ids, len(venue_ids))
+    artist_ids = rng.sample(artist_ids, len(artist_ids))
+    venue_weights = zipf_weights(len(venue_ids))
+    artist_weights = zipf_weights(len(artist_ids))
+    spread = int(SPREAD.total_seconds()) // 1800
+    remaining = count
+    while remaining:
+        size = min(batch_size, remaining)
+        venues = rng.choices(venue_ids, cum_weights=venue_weights, k=size)
+        artists = rng.choices(artist_ids, cum_weights=artist_weights, k=size)
+        for venue_id, artist_id in zip(venues, artists):
+            # on the half hour, within SPREAD of the anchor
+            yield {
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': anchor + timedelta(minutes=30 * rng.randint(-spread, spread))
+            }
+        remaining -= size
+
+
+def insert_rows(model, rows, batch_size):
+    table = model.__table__
+    inserted = 0
+    for batch in chunked(rows, batch_size):
+        insert_batch(table, list(batch[0]), batch)
+        if model is Show:
+            counters.add_shows(batch)
+        db.session.commit()
+        inserted += len(batch)
+    return inserted
+
+
+def seed(venues, artists, shows, seed=42, anchor=None, batch_size=5000):
+    '''
+    seed(venues, artists, shows, seed, anchor, batch_size)
+        inserts the requested number of synthetic rows, returns the number
+        of (venues, artists, shows) inserted
+    '''
+    if anchor is None:
+        anchor = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    # one generator per table, so changing one count leaves the others alone
+    city_weights = zipf_weights(len(CITIES))
+    inserted_venues = insert_rows(
+        Venue, venue_rows(random.Random('{}-venues'.format(seed)), venues, city_weights), batch_size)
+    inserted_artists = insert_rows(
+        Artist, artist_rows(random.Random('{}-artists'.format(seed)), artists, city_weights), batch_size)
+
+    inserted_shows = 0
+    if shows:
+        venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+        artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+        if not venue_ids or not artist_ids:
+            raise click.UsageError('Shows need at least one venue and one artist.')
+        rng = random.Random('{}-shows'.format(seed))
+        inserted_shows = insert_rows(Show, show_rows(rng, shows, venue_ids, artist_ids, anchor, batch_size), batch_size)
+    return inserted_venues, inserted_artists, inserted_shows
+
+
+@click.command('seed')
+@click.option('--venues', default=1000, show_default=True, help='Venues to generate.')
+@click.option('--artists', default=10000, show_default=True, help='Artists to generate.')
+@click.option('--shows', default=100000, show_default=True, help='Shows to generate.')
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Random seed.')
+@click.option('--anchor', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Date the show start times spread around, today by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per insert statement.')
+@click.option('--reset', is_flag=True, help='Delete every show, artist and venue first.')
+@with_appcontext
+def seed_command(venues, artists, shows, seed_value, anchor, batch_size, reset):
+    """Generate a reproducible synthetic data set."""
+    if reset:
+        Show.query.delete()
+        Artist.query.delete()
+        Venue.query.delete()
+        db.session.commit()
+    elif (venues and Venue.query.first()) or (artists and Artist.query.first()):
+        # names are unique, a second run would collide with the first
+        raise click.UsageError('The database is not empty, pass --reset to replace its data.')
+    start = time.perf_counter()
+    counts = seed(venues, artists, shows, seed_value, anchor, batch_size)
+    click.echo('Seeded {} venues, {} artists and {} shows in {:.2f}s'.format(
+        *counts, time.perf_counter() - start))
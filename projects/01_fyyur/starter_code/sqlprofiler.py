@@ -0,0 +1,171 @@
+#----------------------------------------------------------------------------#
+# SQL profiler
+#----------------------------------------------------------------------------#
+
+# Opt-in per-request SQL profiling, enabled with SQL_PROFILER = True in the
+# app config or SQL_PROFILER=1 in the environment. When disabled nothing is
+# hooked, so it costs a config lookup at startup and nothing per request.
+#
+# For each request it records the number of queries, the time spent in the
+# database and how often each statement shape (the SQL with literals folded)
+# ran. A SELECT shape repeated SQL_PROFILER_N_PLUS_ONE times or more is
+# flagged as a likely N+1 loop. The summary goes in the X-SQL-Profile response
+# header and, when SQL_PROFILER_LOG is set, one NDJSON line per request is
+# appended there for `flask sql-report` to aggregate.
+#
+# Fyyur, Bookshelf and trivia each ship this same file, as every app is
+# installed and run on its own from its directory. The copy in
+# projects/01_fyyur/starter_code is the tested one; test_app.py checks that
+# the other two still match it.
+
+import json
+import os
+import re
+import time
+from collections import Counter, defaultdict
+
+import click
+from flask import g, request, has_request_context
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HEADER = 'X-SQL-Profile'
+
+_NUMBERS = re.compile(r'\b\d+\b')
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_LISTS = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+_hooked = False
+
+
+def statement_shape(statement):
+    # the same query with different literals or IN list sizes has one shape
+    shape = _STRINGS.sub('?', statement)
+    shape = _NUMBERS.sub('?', shape)
+    shape = _LISTS.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def suspects(self, threshold):
+        return [
+            (shape, count) for shape, count in self.shapes.most_common()
+            if count >= threshold and shape.upper().startswith('SELECT')
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        # a failed statement never reaches after_cursor_execute, so keep one
+        # start time per connection rather than a stack
+        conn.info['sql_profiler_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        started = conn.info.pop('sql_profiler_started', None)
+        profile = g.sql_profile
+        profile.queries += 1
+        if started is not None:
+            profile.seconds += time.perf_counter() - started
+        profile.shapes[statement_shape(statement)] += 1
+
+
+class SQLProfiler:
+    '''
+    SQLProfiler(app)
+        hooks the SQLAlchemy engine events and the request cycle of app when
+        profiling is enabled; always registers the sql-report command
+    '''
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _hooked
+        app.cli.add_command(report_command)
+        enabled = app.config.get('SQL_PROFILER', os.environ.get('SQL_PROFILER') == '1')
+        if not enabled:
+            return
+        self.threshold = app.config.get('SQL_PROFILER_N_PLUS_ONE', 5)
+        self.log_path = app.config.get('SQL_PROFILER_LOG', os.environ.get('SQL_PROFILER_LOG'))
+
+        if not _hooked:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _hooked = True
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.sql_profile = RequestProfile()
+
+    def finish(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        suspects = profile.suspects(self.threshold)
+        response.headers[HEADER] = 'queries={}; db_ms={:.2f}; n_plus_one={}'.format(
+            profile.queries, profile.seconds * 1000, len(suspects))
+        if self.log_path:
+            with open(self.log_path, 'a') as log:
+                log.write(json.dumps({
+                    'endpoint': request.endpoint,
+                    'method': request.method,
+                    'queries': profile.queries,
+                    'db_ms': round(profile.seconds * 1000, 3),
+                    'n_plus_one': [{'shape': shape, 'count': count} for shape, count in suspects]
+                }) + '\n')
+        return response
+
+
+def aggregate(lines):
+    '''
+    aggregate(lines)
+        folds the NDJSON request records into one row per endpoint, sorted
+        by total database time
+    '''
+    endpoints = defaultdict(lambda: {
+        'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'n_plus_one': Counter()
+    })
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        stats = endpoints['{} {}'.format(record['method'], record['endpoint'])]
+        stats['requests'] += 1
+        stats['queries'] += record['queries']
+        stats['max_queries'] = max(stats['max_queries'], record['queries'])
+        stats['db_ms'] += record['db_ms']
+        for suspect in record['n_plus_one']:
+            stats['n_plus_one'][suspect['shape']] += 1
+    return sorted(endpoints.items(), key=lambda item: item[1]['db_ms'], reverse=True)
+
+
+@click.command('sql-report')
+@click.option('--log', 'log_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='NDJSON written by the profiler, SQL_PROFILER_LOG by default.')
+@with_appcontext
+def report_command(log_path):
+    """Summarize the per-request SQL profile log by endpoint."""
+    from flask import current_app
+    log_path = log_path or current_app.config.get('SQL_PROFILER_LOG', os.environ.get('SQL_PROFILER_LOG'))
+    if not log_path or not os.path.exists(log_path):
+        raise click.UsageError('No profile log, set SQL_PROFILER_LOG or pass --log.')
+    with open(log_path) as log:
+        rows = aggregate(log)
+    click.echo('{:<40} {:>8} {:>10} {:>8} {:>10}'.format('endpoint', 'requests', 'avg q', 'max q', 'avg db ms'))
+    for endpoint, stats in rows:
+        click.echo('{:<40} {:>8} {:>10.1f} {:>8} {:>10.2f}'.format(
+            endpoint, stats['requests'], stats['queries'] / stats['requests'],
+            stats['max_queries'], stats['db_ms'] / stats['requests']))
+        for shape, requests in stats['n_plus_one'].most_common(3):
+            click.echo('    likely N+1 in {} requests: {}'.format(requests, shape[:120]))
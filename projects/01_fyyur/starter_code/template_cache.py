@@ -0,0 +1,196 @@
+#----------------------------------------------------------------------------#
+# Template caches
+#----------------------------------------------------------------------------#
+
+# Two caches for the Jinja side of a request:
+#
+# - a bytecode cache on disk (TEMPLATE_BYTECODE_CACHE_DIR), so a new worker
+#   loads compiled templates instead of compiling them again; run
+#   `flask warm-templates` at deploy time to fill it before the first request
+# - a {% cache key[, ttl] %} ... {% endcache %} tag that stores the rendered
+#   fragment, for large blocks that rarely change such as the venue areas;
+#   without a ttl it is kept for FRAGMENT_CACHE_TTL seconds:
+#
+#     {% cache 'venues:' ~ genre %} ... {% endcache %}
+#
+# The part of the key before the first ':' names the fragment. Committed
+# writes to the tables listed for that name in INVALIDATED_BY drop all of its
+# cached fragments: each name has a generation token, stored in the cache
+# backend next to the fragments, which is part of their keys. With a shared
+# backend a write in one process invalidates the fragments of every process;
+# with the default in-process LRU the other workers catch up after the ttl.
+
+import os
+import threading
+import uuid
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from werkzeug.utils import import_string
+
+from cache import LRUCache, MISSING
+
+# fragment name -> tables whose writes invalidate it; new and swept shows
+# change the upcoming show counters on Venue and Artist, so they count too
+INVALIDATED_BY = {
+    'venues': ('Venue',),
+    'artists': ('Artist',),
+}
+
+
+class FragmentCache:
+    '''
+    FragmentCache(backend, ttl)
+        rendered template fragments keyed by name generation and key, in
+        LRUCache or any backend with the same get/set(key, value, ttl)/
+        delete/clear methods
+    '''
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, config):
+        ttl = config.get('FRAGMENT_CACHE_TTL', 300)
+        backend = config.get('FRAGMENT_CACHE_BACKEND')
+        if backend is None:
+            return cls(LRUCache(config.get('FRAGMENT_CACHE_SIZE', 256), ttl), ttl)
+        if isinstance(backend, str):
+            backend = import_string(backend)()
+        return cls(backend, ttl)
+
+    @staticmethod
+    def name(key):
+        return str(key).split(':', 1)[0]
+
+    def generation(self, name):
+        key = 'fragment-generation:' + name
+        token = self.backend.get(key)
+        if token is MISSING or token is None:
+            # an evicted or expired token only invalidates the fragments
+            token = uuid.uuid4().hex
+            self.backend.set(key, token, ttl=self.ttl)
+        return token
+
+    def get_or_render(self, key, render, ttl=None):
+        full_key = 'fragment:{}:{}'.format(self.generation(self.name(key)), key)
+        value = self.backend.get(full_key)
+        if value is MISSING or value is None:
+            value = render()
+            self.backend.set(full_key, value, ttl=ttl or self.ttl)
+        return value
+
+    def invalidate(self, name):
+        self.backend.delete('fragment-generation:' + name)
+
+    def invalidate_tables(self, tables):
+        for name, dependencies in INVALIDATED_BY.items():
+            if not tables.isdisjoint(dependencies):
+                self.invalidate(name)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache key[, ttl] %} body {% endcache %}; renders the body every time
+    # when the environment has no fragment_cache
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        # the body is already escaped; a shared backend hands back a plain str
+        return Markup(cache.get_or_render(key, caller, ttl))
+
+
+#  ----------------------------------------------------------------
+#  Invalidation
+#  ----------------------------------------------------------------
+
+# Tables written by a connection are collected until its transaction commits
+# and handed to the fragment cache of the current app once the session commit
+# is done, so a request cannot cache the old data between the invalidation
+# and the commit.
+
+_committed = threading.local()
+
+
+def _after_execute(conn, clauseelement, *args):
+    if isinstance(clauseelement, UpdateBase) and getattr(clauseelement, 'table', None) is not None:
+        conn.info.setdefault('fragment_tables', set()).add(clauseelement.table.name)
+
+
+def _commit(conn):
+    tables = conn.info.pop('fragment_tables', None)
+    if tables:
+        _committed.tables = getattr(_committed, 'tables', set()) | tables
+
+
+def _rollback(conn):
+    conn.info.pop('fragment_tables', None)
+
+
+def _after_commit(session):
+    tables = getattr(_committed, 'tables', None)
+    if tables:
+        _committed.tables = set()
+        cache = current_app.extensions.get('fragment_cache') if has_app_context() else None
+        if cache is not None:
+            cache.invalidate_tables(tables)
+
+
+# once for every app, each finds its own cache
+event.listen(Engine, 'after_execute', _after_execute)
+event.listen(Engine, 'commit', _commit)
+event.listen(Engine, 'rollback', _rollback)
+event.listen(Session, 'after_commit', _after_commit)
+
+
+@click.command('warm-templates')
+@with_appcontext
+def warm_templates_command():
+    """Compile every template into the bytecode cache."""
+    env = current_app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    for name in names:
+        env.get_template(name)
+    click.echo('Compiled {} templates into {}'.format(
+        len(names), current_app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')))
+
+
+def init_template_caches(app):
+    '''
+    init_template_caches(app)
+        sets up the bytecode cache and the {% cache %} tag for app, returns
+        its FragmentCache
+    '''
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    fragment_cache = FragmentCache.from_config(app.config)
+    app.jinja_env.fragment_cache = fragment_cache
+    app.cli.add_command(warm_templates_command)
+    return fragment_cache
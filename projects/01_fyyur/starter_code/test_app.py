@@ -0,0 +1,1046 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import create_engine, event, exc, text
+
+from app import create_app
+from autocomplete import PrefixIndex
+from database import TimedQueuePool
+from cache import LRUCache, MISSING, PageCache
+from filters import format_datetime, format_datetimes
+from models import db, Venue, Artist, Show
+from seed import seed
+import counters
+import importer
+import purge
+from sqlprofiler import SQLProfiler, aggregate, statement_shape
+
+app = create_app({'AUTOCOMPLETE_BUILD_AT_START': False})
+page_cache = app.extensions['page_cache']
+fragment_cache = app.extensions['fragment_cache']
+autocomplete = app.extensions['autocomplete']
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "fyyur_test"
+        self.database_path = "postgresql://{}/{}".format('localhost:5432', self.database_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.app = app
+        self.client = self.app.test_client
+
+        # binds the app to the current context
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            autocomplete.build()
+        page_cache.backend.clear()
+        fragment_cache.backend.clear()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def add_venue(self, name, city='San Francisco', state='CA'):
+        venue = Venue(
+            name=name,
+            city=city,
+            state=state,
+            address='1015 Folsom Street',
+            phone='123-123-1234',
+            image_link='https://example.com/venue.jpg',
+            genres=['Jazz']
+        )
+        db.session.add(venue)
+        db.session.flush()
+        return venue
+
+    def add_artist(self, name):
+        artist = Artist(
+            name=name,
+            city='San Francisco',
+            state='CA',
+            phone='326-123-5000',
+            image_link='https://example.com/artist.jpg',
+            genres=['Jazz']
+        )
+        db.session.add(artist)
+        db.session.flush()
+        return artist
+
+    def add_show(self, venue, artist, start_time):
+        show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time)
+        db.session.add(show)
+        return show
+
+    def count_queries(self, path, method='get', **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            res = getattr(self.client(), method)(path, **kwargs)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return res, len(statements)
+
+    def seed_venues(self, count, city='San Francisco'):
+        with self.app.app_context():
+            artist = self.add_artist('Artist in ' + city)
+            for i in range(count):
+                venue = self.add_venue('Venue {} in {}'.format(i, city), city=city)
+                self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+                self.add_show(venue, artist, datetime.utcnow() - timedelta(days=1))
+            db.session.commit()
+
+    def test_venues_groups_by_area(self):
+        self.seed_venues(2, city='San Francisco')
+        self.seed_venues(1, city='New York')
+        res = self.client().get('/venues')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(body.count('<h3>'), 2)
+        self.assertIn('New York, CA', body)
+        self.assertIn('San Francisco, CA', body)
+        self.assertEqual(body.count('(1 upcoming shows)'), 3)
+
+    def test_venues_query_count_does_not_grow_with_venues(self):
+        self.seed_venues(2)
+        res, few = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        self.seed_venues(20, city='Oakland')
+        res, many = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, 1)
+
+    def test_search_venues_counts_upcoming_shows_in_one_query(self):
+        self.seed_venues(3)
+        res, queries = self.count_queries('/venues/search', method='post', data={'search_term': 'venue 1'})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Venue 1 in San Francisco', body)
+        self.assertNotIn('Venue 2 in San Francisco', body)
+        self.assertLessEqual(queries, 2)
+
+    def test_search_artists_is_case_insensitive(self):
+        with self.app.app_context():
+            self.add_artist('The Wild Sax Band')
+            self.add_artist('Guns N Petals')
+            db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'band'})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Wild Sax Band', body)
+        self.assertNotIn('Guns N Petals', body)
+
+    def test_show_venue_query_count_does_not_grow_with_shows(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            venue_id = venue.id
+            artist = self.add_artist('Guns N Petals')
+            self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+            self.add_show(venue, artist, datetime.utcnow() - timedelta(days=1))
+            db.session.commit()
+        res, few = self.count_queries('/venues/{}'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+
+        with self.app.app_context():
+            venue = Venue.query.get(venue_id)
+            for i in range(10):
+                artist = self.add_artist('Artist {}'.format(i))
+                self.add_show(venue, artist, datetime.utcnow() + timedelta(days=i + 1))
+                self.add_show(venue, artist, datetime.utcnow() - timedelta(days=i + 1))
+            db.session.commit()
+        page_cache.invalidate('venue', venue_id)
+        res, many = self.count_queries('/venues/{}'.format(venue_id))
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('11 Upcoming Shows', body)
+        self.assertIn('11 Past Shows', body)
+        self.assertEqual(few, many)
+
+    def test_show_artist_splits_past_and_upcoming_shows(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            artist_id = artist.id
+            self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+            self.add_show(venue, artist, datetime.utcnow() + timedelta(days=2))
+            self.add_show(venue, artist, datetime.utcnow() - timedelta(days=1))
+            db.session.commit()
+        res, queries = self.count_queries('/artists/{}'.format(artist_id))
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('2 Upcoming Shows', body)
+        self.assertIn('1 Past Show', body)
+        self.assertEqual(queries, 1)
+
+    def test_404_for_missing_venue(self):
+        res = self.client().get('/venues/1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_shows_are_paginated_with_a_cursor(self):
+        self.addCleanup(self.app.config.__setitem__, 'SHOWS_PER_PAGE', self.app.config['SHOWS_PER_PAGE'])
+        self.app.config['SHOWS_PER_PAGE'] = 2
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            for i in range(5):
+                self.add_show(venue, artist, datetime(2030, 1, 1) - timedelta(days=i))
+            db.session.commit()
+
+        seen = 0
+        path = '/shows'
+        while path:
+            res, queries = self.count_queries(path)
+            body = res.get_data(as_text=True)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(queries, 1)
+            seen += body.count('tile-show')
+            next_link = re.search(r'href="(/shows\?before=[^"]+)"', body)
+            path = next_link.group(1).replace('&amp;', '&') if next_link else None
+
+        self.assertEqual(seen, 5)
+
+    def test_shows_rejects_invalid_cursor(self):
+        res = self.client().get('/shows?before=nonsense')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_venue_page_is_cached_until_edited(self):
+        with self.app.app_context():
+            venue_id = self.add_venue('The Musical Hop').id
+            db.session.commit()
+        hits = page_cache.hits
+        res, first = self.count_queries('/venues/{}'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+        res, second = self.count_queries('/venues/{}'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(second, 0)
+        self.assertEqual(page_cache.stats()['hits'], hits + 1)
+
+        res = self.client().post('/venues/{}/edit'.format(venue_id), data={
+            'name': 'The Dueling Pianos Bar',
+            'city': 'New York',
+            'state': 'NY',
+            'address': '335 Delancey Street',
+            'phone': '914-003-1132',
+            'genres': ['Jazz'],
+            'image_link': 'https://example.com/venue.jpg',
+            'seeking_description': 'Looking for jazz bands'
+        })
+        self.assertEqual(res.status_code, 302)
+        res = self.client().get('/venues/{}'.format(venue_id))
+        self.assertIn('The Dueling Pianos Bar', res.get_data(as_text=True))
+
+    def test_editing_a_venue_refreshes_the_pages_of_its_artists(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            db.session.flush()
+            self.add_show(venue, artist, datetime.now() + timedelta(days=1))
+            db.session.commit()
+            venue_id, artist_id = venue.id, artist.id
+        self.client().get('/artists/{}'.format(artist_id))
+        res, queries = self.count_queries('/artists/{}'.format(artist_id))
+        self.assertEqual(queries, 0)
+
+        res = self.client().post('/venues/{}/edit'.format(venue_id), data={
+            'name': 'The Dueling Pianos Bar',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1015 Folsom Street',
+            'phone': '123-123-1234',
+            'genres': ['Jazz'],
+            'image_link': 'https://example.com/venue.jpg',
+            'seeking_description': 'Looking for jazz bands'
+        })
+        self.assertEqual(res.status_code, 302)
+        res = self.client().get('/artists/{}'.format(artist_id))
+        self.assertIn('The Dueling Pianos Bar', res.get_data(as_text=True))
+
+    def test_artists_filtered_by_genre(self):
+        with self.app.app_context():
+            self.add_artist('Guns N Petals').genres = ['Rock_n_Roll']
+            self.add_artist('The Wild Sax Band').genres = ['Jazz', 'Classical']
+            db.session.commit()
+        res = self.client().get('/artists?genre=Jazz')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Wild Sax Band', body)
+        self.assertNotIn('Guns N Petals', body)
+
+    def test_venues_reject_unknown_genre(self):
+        res = self.client().get('/venues?genre=Polka')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_genre_facets(self):
+        with self.app.app_context():
+            self.add_venue('The Musical Hop').genres = ['Jazz', 'Hip_Hop']
+            self.add_artist('Guns N Petals').genres = ['Rock_n_Roll']
+            self.add_artist('The Wild Sax Band').genres = ['Jazz']
+            db.session.commit()
+        res, queries = self.count_queries('/genres')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 1)
+        self.assertEqual(data['venues']['Jazz'], 1)
+        self.assertEqual(data['venues']['Hip-Hop'], 1)
+        self.assertEqual(data['artists']['Jazz'], 1)
+        self.assertEqual(data['artists']['Rock n Roll'], 1)
+        self.assertEqual(data['artists']['Blues'], 0)
+
+    def test_api_venue_answers_304_until_it_changes(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            venue_id = venue.id
+            artist = self.add_artist('Guns N Petals')
+            artist_id = artist.id
+            self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+            db.session.commit()
+        res = self.client().get('/api/venues/{}'.format(venue_id))
+        etag = res.headers['ETag']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['venue']['upcoming_shows_count'], 1)
+        self.assertFalse(etag.startswith('W/'))
+
+        res, queries = self.count_queries('/api/venues/{}'.format(venue_id), headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(queries, 1)
+
+        with self.app.app_context():
+            Artist.query.get(artist_id).name = 'Guns N Roses'
+            db.session.commit()
+        res = self.client().get('/api/venues/{}'.format(venue_id), headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['venue']['upcoming_shows'][0]['artist_name'], 'Guns N Roses')
+
+    def test_api_shows_and_search(self):
+        self.seed_venues(3)
+        res = self.client().get('/api/shows?limit=4')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['shows']), 4)
+        self.assertIsNotNone(data['next_cursor'])
+        self.assertEqual(self.client().get('/api/shows?limit=0').status_code, 400)
+        self.assertEqual(self.client().get('/api/shows?limit=-3').status_code, 400)
+
+        res = self.client().get('/api/search?type=venues&q=Venue 2')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['data'][0]['num_upcoming_shows'], 1)
+
+        etag = res.headers['ETag']
+        res = self.client().get('/api/search?type=venues&q=Venue 2', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_counters_follow_show_writes(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            other = self.add_venue('The Dueling Pianos Bar')
+            show = self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+            self.add_show(venue, artist, datetime.utcnow() - timedelta(days=1))
+            db.session.commit()
+            self.assertEqual((venue.upcoming_shows_count, artist.upcoming_shows_count), (1, 1))
+
+            show.venue_id = other.id
+            db.session.commit()
+            self.assertEqual((venue.upcoming_shows_count, other.upcoming_shows_count), (0, 1))
+
+            db.session.delete(show)
+            db.session.commit()
+            self.assertEqual((other.upcoming_shows_count, artist.upcoming_shows_count), (0, 0))
+
+    def test_create_show_increments_counters(self):
+        with self.app.app_context():
+            venue_id = self.add_venue('The Musical Hop').id
+            artist_id = self.add_artist('Guns N Petals').id
+            db.session.commit()
+        res = self.client().post('/shows/create', data={
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': (datetime.utcnow() + timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 1)
+            self.assertEqual(Artist.query.get(artist_id).upcoming_shows_count, 1)
+
+    def test_sweep_moves_started_shows_out(self):
+        self.seed_venues(2)
+        with self.app.app_context():
+            self.assertEqual(counters.sweep(datetime.utcnow() + timedelta(days=2)), 2)
+            self.assertEqual([venue.upcoming_shows_count for venue in Venue.query], [0, 0])
+            self.assertEqual(Artist.query.one().upcoming_shows_count, 0)
+            self.assertEqual(counters.verify(), [])
+
+    def test_verify_reports_and_repairs_drift(self):
+        self.seed_venues(1)
+        with self.app.app_context():
+            venue = Venue.query.one()
+            db.session.execute(Venue.__table__.update().values(upcoming_shows_count=5))
+            db.session.commit()
+
+            self.assertEqual(counters.verify(), [('Venue', venue.id, 5, 1)])
+            counters.verify(repair=True)
+            self.assertEqual(counters.verify(), [])
+            self.assertEqual(Venue.query.one().upcoming_shows_count, 1)
+
+    def test_deleted_venue_is_hidden_until_purged(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            other = self.add_venue('The Dueling Pianos Bar')
+            artist = self.add_artist('Guns N Petals')
+            self.add_show(venue, artist, datetime.utcnow() + timedelta(days=1))
+            self.add_show(other, artist, datetime.utcnow() + timedelta(days=2))
+            db.session.commit()
+            venue_id, artist_id = venue.id, artist.id
+        self.assertIn('The Musical Hop', self.client().get('/artists/{}'.format(artist_id)).get_data(as_text=True))
+
+        res = self.client().post('/venues/{}/delete'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.client().get('/venues/{}'.format(venue_id)).status_code, 404)
+        self.assertEqual(self.client().get('/api/venues/{}'.format(venue_id)).status_code, 404)
+        self.assertNotIn('The Musical Hop', self.client().get('/venues').get_data(as_text=True))
+        self.assertNotIn('The Musical Hop', self.client().get('/artists/{}'.format(artist_id)).get_data(as_text=True))
+        shows = self.client().get('/api/shows').get_json()['shows']
+        self.assertEqual([show['venue_name'] for show in shows], ['The Dueling Pianos Bar'])
+        self.assertEqual(self.client().get('/autocomplete?type=venues&q=mus').get_json()['count'], 0)
+        with self.app.app_context():
+            self.assertEqual(Show.booking_errors(venue_id, artist_id, datetime.utcnow() + timedelta(days=5)),
+                             {'venue_id': ['There is no venue with id {}.'.format(venue_id)]})
+            # the rows stay until the purge
+            self.assertEqual(Show.query.count(), 2)
+            self.assertIsNotNone(Venue.query.execution_options(include_deleted=True).get(venue_id))
+
+            self.assertEqual(purge.purge(), {'venues': 1, 'artists': 0, 'shows': 1})
+            self.assertEqual(Show.query.count(), 1)
+            self.assertIsNone(Venue.query.execution_options(include_deleted=True).get(venue_id))
+            self.assertEqual(Artist.query.get(artist_id).upcoming_shows_count, 1)
+            self.assertEqual(counters.verify(), [])
+
+    def test_delete_is_a_post(self):
+        with self.app.app_context():
+            venue_id = self.add_venue('The Musical Hop').id
+            db.session.commit()
+
+        self.assertEqual(self.client().get('/venues/{}/delete'.format(venue_id)).status_code, 405)
+        self.assertEqual(self.client().get('/venues/{}'.format(venue_id)).status_code, 200)
+
+    def test_deleted_name_can_be_taken_again(self):
+        with self.app.app_context():
+            venue_id = self.add_venue('The Musical Hop').id
+            db.session.commit()
+        self.client().post('/venues/{}/delete'.format(venue_id))
+
+        with self.app.app_context():
+            self.add_venue('The Musical Hop')
+            db.session.commit()
+            self.assertEqual(Venue.query.execution_options(include_deleted=True).filter_by(
+                name='The Musical Hop').count(), 2)
+            with self.assertRaises(exc.IntegrityError):
+                self.add_venue('The Musical Hop')
+                db.session.commit()
+
+    def test_purge_deletes_shows_in_batches(self):
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            for day in range(5):
+                self.add_show(venue, artist, datetime.utcnow() + timedelta(days=day + 1))
+            db.session.commit()
+            artist_id = artist.id
+        self.client().post('/artists/{}/delete'.format(artist_id))
+        self.assertEqual(self.client().get('/artists/{}'.format(artist_id)).status_code, 404)
+
+        commits = []
+
+        def after_commit(session):
+            commits.append(session)
+
+        with self.app.app_context():
+            event.listen(db.session, 'after_commit', after_commit)
+            try:
+                self.assertEqual(purge.purge(batch_size=2), {'venues': 0, 'artists': 1, 'shows': 5})
+            finally:
+                event.remove(db.session, 'after_commit', after_commit)
+            # three batches of shows, then the artist
+            self.assertEqual(len(commits), 4)
+            self.assertEqual(Show.query.count(), 0)
+            self.assertEqual(Venue.query.one().upcoming_shows_count, 0)
+
+    def test_venue_areas_fragment_is_cached_until_a_write(self):
+        self.seed_venues(1)
+        self.client().get('/venues')
+        res, queries = self.count_queries('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 0)
+
+        self.seed_venues(1, city='New York')
+        body = self.client().get('/venues').get_data(as_text=True)
+        self.assertIn('New York', body)
+
+    def test_fragments_are_kept_for_the_configured_ttl(self):
+        ttls = []
+        set_fragment = fragment_cache.backend.set
+        self.addCleanup(setattr, fragment_cache, 'ttl', fragment_cache.ttl)
+        self.addCleanup(setattr, fragment_cache.backend, 'set', set_fragment)
+        fragment_cache.ttl = 42
+        fragment_cache.backend.set = lambda key, value, ttl=None: (
+            ttls.append((key, ttl)), set_fragment(key, value, ttl))
+        self.client().get('/venues')
+        self.client().get('/artists')
+
+        self.assertEqual([ttl for key, ttl in ttls if key.startswith('fragment:')], [42, 42])
+
+    def test_create_show_rejects_double_booking_and_unknown_ids(self):
+        start_time = datetime(2030, 5, 1, 20, 0)
+        with self.app.app_context():
+            venue_id = self.add_venue('The Musical Hop').id
+            artist_id = self.add_artist('Guns N Petals').id
+            other_artist_id = self.add_artist('Matt Quevedo').id
+            db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, duration=120))
+            db.session.commit()
+
+        def post(venue_id, artist_id, start_time):
+            return self.client().post('/shows/create', data={
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'duration': 60
+            }).get_data(as_text=True)
+
+        self.assertIn('venue is already booked', post(venue_id, other_artist_id, start_time + timedelta(hours=1)))
+        self.assertIn('no artist with id 999', post(venue_id, 999, start_time + timedelta(hours=3)))
+        self.assertIn('successfully listed', post(venue_id, other_artist_id, start_time + timedelta(hours=2)))
+        with self.app.app_context():
+            self.assertEqual(Show.query.count(), 2)
+
+    def test_batch_booking_errors(self):
+        start_time = datetime(2030, 5, 1, 20, 0)
+        with self.app.app_context():
+            venue = self.add_venue('The Musical Hop')
+            artist = self.add_artist('Guns N Petals')
+            other = self.add_artist('Matt Quevedo')
+            db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time, duration=120))
+            db.session.commit()
+
+            def row(artist_id, hours, duration=60, venue_id=venue.id):
+                return {
+                    'venue_id': venue_id,
+                    'artist_id': artist_id,
+                    'start_time': start_time + timedelta(hours=hours),
+                    'duration': duration
+                }
+
+            errors = Show.batch_booking_errors([
+                row(other.id, 1),                 # overlaps the booked show
+                row(other.id, 2),                 # starts as it ends
+                row(other.id, 2.5),               # overlaps the row above
+                row(other.id, 30, venue_id=999),  # unknown venue
+                row(other.id, 48)
+            ])
+
+        self.assertEqual(sorted(errors), [0, 2, 3])
+        self.assertIn('already booked', errors[0]['venue_id'][0])
+        self.assertIn('twice', errors[2]['venue_id'][0])
+        self.assertIn('no venue with id 999', errors[3]['venue_id'][0])
+
+    def test_api_calendar_filters_by_range_and_place(self):
+        weekend = datetime(2030, 5, 4, 20, 0)
+        with self.app.app_context():
+            hop = self.add_venue('The Musical Hop')
+            park = self.add_venue('Park Square Live Music', city='New York', state='NY')
+            artist = self.add_artist('Guns N Petals')
+            other = self.add_artist('Matt Quevedo')
+            for day in range(3):
+                self.add_show(hop, artist, weekend + timedelta(days=day))
+            self.add_show(hop, other, weekend + timedelta(hours=3))
+            self.add_show(park, other, weekend)
+            self.add_show(hop, artist, weekend + timedelta(days=30))
+            db.session.commit()
+            artist_id = artist.id
+
+        res = self.client().get('/api/calendar?start=2030-05-04&end=2030-05-06&city=San Francisco&state=CA&limit=2')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([show['start_time'] for show in data['shows']], ['2030-05-04T20:00:00', '2030-05-04T23:00:00'])
+
+        res = self.client().get('/api/calendar?start=2030-05-04&end=2030-05-06&city=San Francisco&state=CA&limit=2&after=' + data['next_cursor'])
+        data = res.get_json()
+
+        self.assertEqual([show['start_time'] for show in data['shows']], ['2030-05-05T20:00:00'])
+        self.assertIsNone(data['next_cursor'])
+
+        res = self.client().get('/api/calendar?start=2030-05-01&end=2030-06-01&artist_id={}'.format(artist_id))
+        self.assertEqual(len(res.get_json()['shows']), 3)
+
+    def test_api_calendar_requires_a_bounded_range(self):
+        self.assertEqual(self.client().get('/api/calendar?start=2030-05-04').status_code, 400)
+        self.assertEqual(self.client().get('/api/calendar?start=2030-05-04&end=2030-05-03').status_code, 400)
+        self.assertEqual(self.client().get('/api/calendar?start=2030-01-01&end=2031-01-01').status_code, 400)
+        self.assertEqual(self.client().get('/api/calendar?start=soon&end=2030-05-03').status_code, 400)
+        self.assertEqual(self.client().get('/api/calendar?start=2030-05-02&end=2030-05-03&limit=-1').status_code, 400)
+
+    def test_autocomplete_ranks_by_upcoming_shows_and_follows_writes(self):
+        with self.app.app_context():
+            hop = self.add_venue('The Musical Hop')
+            park = self.add_venue('Park Square Live Music & Coffee')
+            self.add_venue('The Dueling Pianos Bar')
+            artist = self.add_artist('Guns N Petals')
+            self.add_show(park, artist, datetime.utcnow() + timedelta(days=1))
+            db.session.commit()
+            hop_id = hop.id
+        # rows added behind the back of the handlers wait for a rebuild
+        self.assertEqual(self.client().get('/autocomplete?q=MUS').get_json()['count'], 0)
+        autocomplete.start(app).join()
+
+        res = self.client().get('/autocomplete?q=MUS')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([venue['name'] for venue in data['data']],
+                         ['Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(data['data'][0]['num_upcoming_shows'], 1)
+        self.assertEqual(self.client().get('/autocomplete?q=mus&limit=1').get_json()['count'], 1)
+
+        self.client().post('/venues/{}/edit'.format(hop_id), data={
+            'name': 'The Mellow Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '123-123-1234', 'genres': ['Jazz'], 'image_link': 'https://example.com/venue.jpg'})
+        self.client().post('/venues/create', data={
+            'name': 'Museum Stage', 'city': 'Austin', 'state': 'TX', 'address': '1 Congress Ave',
+            'phone': '512-555-0000', 'genres': ['Jazz'], 'image_link': 'https://example.com/venue.jpg',
+            'facebook_link': 'https://www.facebook.com/museumstage'})
+        self.client().post('/venues/{}/delete'.format(hop_id))
+
+        names = [venue['name'] for venue in self.client().get('/autocomplete?q=mus').get_json()['data']]
+        self.assertEqual(names, ['Park Square Live Music & Coffee', 'Museum Stage'])
+        self.assertEqual(self.client().get('/autocomplete?q=mellow').get_json()['count'], 0)
+        self.assertEqual(self.client().get('/autocomplete?type=artists&q=pet').get_json()['data'][0]['name'],
+                         'Guns N Petals')
+        self.assertEqual(self.client().get('/autocomplete?type=shows&q=a').status_code, 400)
+
+    def test_autocomplete_is_built_when_the_app_starts(self):
+        with self.app.app_context():
+            self.add_venue('The Musical Hop')
+            db.session.commit()
+        with tempfile.TemporaryDirectory() as directory:
+            started = create_app({
+                'SQLALCHEMY_DATABASE_URI': self.database_path,
+                'LOG_FILE': os.path.join(directory, 'error.log'),
+                'ACCESS_LOG_FILE': os.path.join(directory, 'access.log')
+            })
+            started.extensions['log_listener'].stop()
+        started_autocomplete = started.extensions['autocomplete']
+        # the build create_app started, or a new one once it is done
+        started_autocomplete.start(started).join()
+
+        with started.app_context():
+            self.assertEqual([venue['name'] for venue in started_autocomplete.search(Venue, 'mus')],
+                             ['The Musical Hop'])
+
+    def test_read_only_handlers_use_the_replica_until_the_client_writes(self):
+        binds = app.config['SQLALCHEMY_BINDS']
+        # the test database stands in for its own replica
+        app.config['SQLALCHEMY_BINDS'] = {'replica_0': self.database_path}
+        with self.app.app_context():
+            self.add_venue('The Musical Hop')
+            db.session.commit()
+            replica = db.get_engine(self.app, bind='replica_0')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(replica, 'before_cursor_execute', before_cursor_execute)
+        try:
+            client = self.client()
+            self.assertEqual(client.get('/api/venues').status_code, 200)
+            self.assertTrue(statements)
+            self.assertTrue(all(statement.lstrip().upper().startswith('SELECT') for statement in statements))
+
+            del statements[:]
+            res = client.post('/venues/create', data={
+                'name': 'Park Square Live Music & Coffee', 'city': 'New York', 'state': 'NY',
+                'address': '34 Whiskey Moore Ave', 'phone': '415-000-1234', 'genres': ['Jazz'],
+                'image_link': 'https://example.com/venue.jpg', 'facebook_link': 'https://www.facebook.com/park'})
+            self.assertIn('primary_until', res.headers.get('Set-Cookie', ''))
+
+            # the client that wrote reads its own write from the primary
+            self.assertIn(b'Park Square Live Music', client.get('/venues').data)
+            self.assertEqual(statements, [])
+
+            self.client().get('/shows')
+            self.assertTrue(statements)
+
+            # the pages filling the fragment caches read the primary
+            del statements[:]
+            self.client().get('/venues')
+            self.client().get('/artists')
+            self.assertEqual(statements, [])
+        finally:
+            event.remove(replica, 'before_cursor_execute', before_cursor_execute)
+            replica.dispose()
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+    def test_db_stats_reports_the_primary_pool(self):
+        self.client().get('/venues')
+        self.assertIn('primary', self.client().get('/db/stats').get_json())
+
+    def venue_row(self, name):
+        # a valid NDJSON venue, without the optional fields
+        return {
+            'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '123-123-1234', 'genres': ['Jazz'], 'image_link': 'https://example.com/venue.jpg',
+            'facebook_link': 'https://www.facebook.com/venue'
+        }
+
+    def test_import_writes_empty_text_for_missing_fields(self):
+        with self.app.app_context():
+            self.assertEqual(importer.import_rows('venues', [self.venue_row('The Musical Hop')]), (1, 0))
+            self.assertEqual(Venue.query.one().seeking_description, '')
+            # COPY would read the empty field as NULL otherwise
+            statement = importer.copy_statement(Venue.__table__, ['name', 'seeking_description', 'website_link'])
+            self.assertIn('FORCE_NOT_NULL ("name", "seeking_description")', statement)
+
+    def test_import_reports_rows_the_database_refuses(self):
+        report = io.StringIO()
+        with self.app.app_context():
+            self.add_venue('The Musical Hop')
+            db.session.commit()
+            rows = [self.venue_row(name) for name in ('Park Square', 'The Musical Hop', 'Dueling Pianos', 'Park Square')]
+            self.assertEqual(importer.import_rows('venues', rows, report=report), (2, 2))
+            self.assertEqual(sorted(name for name, in db.session.query(Venue.name)),
+                             ['Dueling Pianos', 'Park Square', 'The Musical Hop'])
+        rejected = [json.loads(line) for line in report.getvalue().splitlines()]
+        self.assertEqual([entry['line'] for entry in rejected], [2, 4])
+        self.assertIn('database', rejected[0]['errors'])
+
+    def test_import_rejects_values_too_long_for_their_column(self):
+        report = io.StringIO()
+        rows = [self.venue_row(name) for name in ('Park Square', 'The Musical Hop', 'Dueling Pianos')]
+        rows[1]['address'] = 'x' * 200
+        with self.app.app_context():
+            self.assertEqual(importer.import_rows('venues', rows, batch_size=1, report=report), (2, 1))
+        [rejected] = [json.loads(line) for line in report.getvalue().splitlines()]
+        self.assertEqual((rejected['line'], list(rejected['errors'])), (2, ['address']))
+
+    def test_import_reports_data_the_database_refuses(self):
+        # what PostgreSQL raises for a value longer than its varchar column
+        def refuse(cursor, statement, parameters, context):
+            if 'Dueling Pianos' in str(parameters):
+                raise sqlite3.DataError('value too long for type character varying(120)')
+
+        report = io.StringIO()
+        rows = [self.venue_row(name) for name in ('Park Square', 'Dueling Pianos', 'The Musical Hop')]
+        with self.app.app_context():
+            engine = db.engine
+            event.listen(engine, 'do_execute', refuse)
+            event.listen(engine, 'do_executemany', refuse)
+            try:
+                self.assertEqual(importer.import_rows('venues', rows, report=report), (2, 1))
+            finally:
+                event.remove(engine, 'do_execute', refuse)
+                event.remove(engine, 'do_executemany', refuse)
+            self.assertEqual(sorted(name for name, in db.session.query(Venue.name)), ['Park Square', 'The Musical Hop'])
+        [rejected] = [json.loads(line) for line in report.getvalue().splitlines()]
+        self.assertEqual(rejected['line'], 2)
+        self.assertIn('value too long', rejected['errors']['database'][0])
+
+    def test_seed_is_reproducible(self):
+        def rows():
+            return (
+                [(v.name, v.city, v.genres) for v in Venue.query.order_by(Venue.id)],
+                [(a.name, a.state, a.looking_for_venue) for a in Artist.query.order_by(Artist.id)],
+                [(s.venue_id - first_venue, s.artist_id - first_artist, s.start_time)
+                 for s in Show.query.order_by(Show.id)]
+            )
+
+        anchor = datetime(2021, 6, 1)
+        with self.app.app_context():
+            self.assertEqual(seed(5, 8, 40, seed=7, anchor=anchor, batch_size=16), (5, 8, 40))
+            first_venue, first_artist = db.session.query(db.func.min(Venue.id), db.func.min(Artist.id)).one()
+            first = rows()
+            Show.query.delete()
+            Artist.query.delete()
+            Venue.query.delete()
+            db.session.commit()
+            seed(5, 8, 40, seed=7, anchor=anchor, batch_size=16)
+            first_venue, first_artist = db.session.query(db.func.min(Venue.id), db.func.min(Artist.id)).one()
+            second = rows()
+
+        self.assertEqual(first, second)
+        self.assertTrue(all(abs(start_time - anchor) <= timedelta(days=365) for _, _, start_time in first[2]))
+
+
+class CreateAppTestCase(unittest.TestCase):
+    """This class represents the app factory test case"""
+
+    def test_heavy_modules_are_imported_on_first_use(self):
+        deferred = ('flask_migrate', 'alembic', 'flask_moment', 'forms')
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys; from app import create_app; create_app(); '
+            'print(",".join(name for name in {!r} if name in sys.modules))'.format(deferred)],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.decode().strip(), '')
+
+    def test_deferred_extensions_load_when_used(self):
+        with app.app_context():
+            self.assertEqual(app.extensions['migrate'].directory, 'migrations')
+            self.assertIs(app.extensions['migrate'].db, db)
+
+
+    def test_each_app_logs_its_requests_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = {
+                'LOG_FILE': os.path.join(directory, 'error.log'),
+                'ACCESS_LOG_FILE': os.path.join(directory, 'access.log'),
+                'AUTOCOMPLETE_BUILD_AT_START': False
+            }
+            apps = [create_app(config) for _ in range(3)]
+            apps[-1].test_client().get('/cache/stats')
+            apps[-1].extensions['log_listener'].stop()
+            with open(config['ACCESS_LOG_FILE']) as access_log:
+                lines = access_log.read().splitlines()
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['route'], '/cache/stats')
+        # the listeners of the replaced handlers are stopped already
+        self.assertTrue(all(created.extensions['log_listener']._thread is None for created in apps))
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """This class represents the page cache test case"""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expires_after_ttl(self):
+        now = [0]
+        cache = LRUCache(max_size=2, ttl=10, clock=lambda: now[0])
+        cache.set('a', 1)
+        now[0] = 11
+
+        self.assertIs(cache.get('a'), MISSING)
+
+
+class PageCacheTestCase(unittest.TestCase):
+    """This class represents the page cache test case"""
+
+    def test_page_loaded_across_an_invalidation_is_not_kept(self):
+        cache = PageCache(LRUCache())
+        pages = iter(['old', 'new'])
+
+        def load():
+            page = next(pages)
+            # a commit lands while the old page is being loaded
+            if page == 'old':
+                cache.invalidate('venue', 1)
+            return page
+
+        self.assertEqual(cache.get_or_load('venue', 1, load), 'old')
+        self.assertEqual(cache.get_or_load('venue', 1, load), 'new')
+        self.assertEqual(cache.get_or_load('venue', 1, load), 'new')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+    """This class represents the autocomplete index test case"""
+
+    def test_cached_results_follow_changes(self):
+        index = PrefixIndex(max_results=2)
+        index.build([(1, 'Blue Room', 0), (2, 'Blue Owl', 3), (3, 'Red Room', 1)])
+
+        self.assertEqual([id for id, name, popularity in index.search('blue')], [2, 1])
+        self.assertEqual([id for id, name, popularity in index.search('ROO')], [3, 1])
+
+        index.adjust(1, 5)
+        index.put(4, 'Blue Harbor')
+        self.assertEqual([id for id, name, popularity in index.search('blue')], [1, 2])
+        self.assertEqual([id for id, name, popularity in index.search('blue h')], [4])
+
+        index.remove(1)
+        self.assertEqual([id for id, name, popularity in index.search('room')], [3])
+
+    def test_changes_during_a_build_are_replayed(self):
+        index = PrefixIndex()
+        index.start_build()
+        index.put(2, 'Golden Owl')
+        index.build([(1, 'Golden Fox', 0)])
+
+        self.assertEqual(sorted(id for id, name, popularity in index.search('gold')), [1, 2])
+
+    def test_a_failed_build_keeps_the_index_and_stops_recording(self):
+        index = PrefixIndex()
+        index.build([(1, 'Golden Fox', 0)])
+
+        def rows():
+            yield 2, 'Golden Owl', 0
+            raise RuntimeError('connection lost')
+
+        index.start_build()
+        with self.assertRaises(RuntimeError):
+            index.build(rows())
+
+        self.assertEqual(index.search('gold'), [(1, 'Golden Fox', 0)])
+        self.assertIsNone(index._pending)
+
+    def test_adjustments_during_a_build_are_not_counted_twice(self):
+        index = PrefixIndex()
+        index.build([(1, 'Golden Fox', 0)])
+        index.start_build()
+        index.adjust(1, 2)
+        # read after the commit of that adjustment
+        index.build([(1, 'Golden Fox', 2)])
+
+        self.assertEqual(index.search('gold'), [(1, 'Golden Fox', 2)])
+
+
+class TimedQueuePoolTestCase(unittest.TestCase):
+    """This class represents the connection pool metrics test case"""
+
+    def test_counts_checkouts_and_timeouts(self):
+        pool = TimedQueuePool(lambda: sqlite3.connect(':memory:'), pool_size=1, max_overflow=0, timeout=0.01)
+        connection = pool.connect()
+        with self.assertRaises(exc.TimeoutError):
+            pool.connect()
+        connection.close()
+        pool.connect().close()
+
+        stats = pool.metrics.stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['checkout_ms']['max'], stats['checkout_ms']['p50'])
+
+
+class FiltersTestCase(unittest.TestCase):
+    """This class represents the datetime filter test case"""
+
+    def test_format_datetime_matches_for_strings_and_datetimes(self):
+        value = datetime(2021, 4, 11, 15, 40)
+
+        self.assertEqual(format_datetime(value, 'full'), 'Sunday April, 11, 2021 at 3:40PM')
+        self.assertEqual(format_datetime(str(value), 'full'), format_datetime(value, 'full'))
+
+    def test_format_datetimes_formats_a_batch(self):
+        values = [datetime(2021, 4, 11, 15, 40), datetime(2021, 4, 12, 9, 5)]
+
+        self.assertEqual(format_datetimes(values), [format_datetime(value) for value in values])
+
+
+class SQLProfilerTestCase(unittest.TestCase):
+    """This class represents the SQL profiler test case"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.app = Flask(__name__)
+        self.app.config.update(SQL_PROFILER=True, SQL_PROFILER_N_PLUS_ONE=3, SQL_PROFILER_LOG=None)
+        SQLProfiler(self.app)
+
+        @self.app.route('/loop/<int:times>')
+        def loop(times):
+            with self.engine.connect() as connection:
+                for id in range(times):
+                    connection.execute(text('SELECT {}'.format(id)))
+            return 'ok'
+
+    def test_header_counts_queries_and_flags_repeats(self):
+        response = self.app.test_client().get('/loop/4')
+
+        self.assertRegex(response.headers['X-SQL-Profile'], r'^queries=4; db_ms=[\d.]+; n_plus_one=1$')
+
+    def test_header_below_threshold(self):
+        response = self.app.test_client().get('/loop/2')
+
+        self.assertTrue(response.headers['X-SQL-Profile'].endswith('n_plus_one=0'))
+
+    def test_disabled_profiler_adds_no_header(self):
+        app = Flask(__name__)
+        app.config['SQL_PROFILER'] = False
+        SQLProfiler(app)
+        app.route('/')(lambda: 'ok')
+
+        self.assertNotIn('X-SQL-Profile', app.test_client().get('/').headers)
+
+    def test_statement_shape_folds_literals_and_lists(self):
+        self.assertEqual(
+            statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?) AND name = 'x'"),
+            statement_shape("SELECT *\nFROM t WHERE id IN (?, ?) AND name = 'y'")
+        )
+
+    def test_aggregate_by_endpoint(self):
+        lines = [
+            '{"endpoint": "shows", "method": "GET", "queries": 3, "db_ms": 1.0, "n_plus_one": []}',
+            '{"endpoint": "shows", "method": "GET", "queries": 5, "db_ms": 3.0, '
+            '"n_plus_one": [{"shape": "SELECT ?", "count": 5}]}'
+        ]
+
+        [(endpoint, stats)] = aggregate(lines)
+
+        self.assertEqual(endpoint, 'GET shows')
+        self.assertEqual((stats['requests'], stats['queries'], stats['max_queries']), (2, 8, 5))
+        self.assertEqual(stats['n_plus_one']['SELECT ?'], 1)
+
+    def test_other_apps_ship_the_same_module(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(here, 'sqlprofiler.py')) as module:
+            source = module.read()
+        for copy in ('../../../Bookshelf/backend/sqlprofiler.py', '../../02_trivia_api/starter/backend/sqlprofiler.py'):
+            path = os.path.normpath(os.path.join(here, copy))
+            if os.path.exists(path):
+                with open(path) as module:
+                    self.assertEqual(module.read(), source, path)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()